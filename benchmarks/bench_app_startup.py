@@ -0,0 +1,56 @@
+from pathlib import Path
+import argparse
+import statistics
+import subprocess
+import sys
+
+CODE_DIR = Path(__file__).parents[1] / 'code'
+# Packages reported in the import-time breakdown, when the app pulls them in
+PACKAGES = ['streamlit', 'numpy', 'pandas', 'sklearn', 'scipy', 'xgboost', 'pyarrow']
+# Runs the app once, presses the button and reruns it, printing first run, first prediction and rerun seconds
+APP_RUN = """
+import sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+start = time.perf_counter(); app.run(); first = time.perf_counter() - start
+start = time.perf_counter(); app.button[0].click().run(); predict = time.perf_counter() - start
+reruns = []
+for _ in range(int(sys.argv[2])):
+    start = time.perf_counter(); app.button[0].click().run(); reruns.append(time.perf_counter() - start)
+if app.exception:
+    raise SystemExit(str(app.exception))
+print(first, predict, *reruns)
+"""
+
+
+def import_times(app):
+    # Cumulative seconds spent importing the app's own modules and the heavy packages, from -X importtime
+    result = subprocess.run([sys.executable, '-W', 'ignore', '-X', 'importtime', '-c',
+                             f'import streamlit; import {app.stem}'], cwd=app.parent, capture_output=True, text=True,
+                            check=True)
+    times = {}
+    for line in result.stderr.splitlines()[1:]:
+        _, cumulative, name = line.split('|')
+        name = name.strip()
+        if name in PACKAGES or (app.parent / f'{name}.py').exists():
+            times[name] = int(cumulative) / 1e6
+    return times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time breakdown, cold start and rerun time of the Streamlit app")
+    parser.add_argument('--app', default=str(CODE_DIR / 'food_app.py'),
+                        help="App script; its directory needs a model and ui_metadata.json (run main.py first)")
+    parser.add_argument('--reruns', type=int, default=20)
+    args = parser.parse_args()
+    app = Path(args.app).resolve()
+
+    print("Import time of the app's modules, after streamlit (cumulative seconds):")
+    for name, seconds in sorted(import_times(app).items(), key=lambda item: -item[1]):
+        print(f"  {name:<20}{seconds:>8.3f}")
+
+    result = subprocess.run([sys.executable, '-W', 'ignore', '-c', APP_RUN, str(app), str(args.reruns)],
+                            cwd=app.parent, capture_output=True, text=True, check=True)
+    first, predict, *reruns = (float(value) for value in result.stdout.split())
+    print(f"\nfirst run: {first:.3f} s, first prediction: {predict:.3f} s, "
+          f"rerun median: {statistics.median(reruns) * 1000:.1f} ms")
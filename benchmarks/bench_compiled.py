@@ -0,0 +1,82 @@
+from pathlib import Path
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+CODE_DIR = Path(__file__).parents[1] / 'code'
+sys.path.insert(0, str(CODE_DIR))
+import artifact  # noqa: E402
+import compiled_predict  # noqa: E402
+import predict  # noqa: E402
+from synthetic import generate_orders  # noqa: E402
+
+# Each snippet runs in a fresh interpreter: load the model and score one order read from stdin
+COLD_START = {
+    'predict.Predictor': "import json, sys, pandas as pd; import predict; "
+                         "predict.Predictor(sys.argv[1]).predict(pd.DataFrame([json.load(sys.stdin)]))",
+    'compiled_predict': "import json, sys; import compiled_predict; "
+                        "compiled_predict.CompiledPredictor(sys.argv[1]).predict([json.load(sys.stdin)])",
+}
+
+
+def cold_start(code, model, order, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-W', 'ignore', '-c', code, str(model)], input=order, text=True, check=True,
+                       cwd=CODE_DIR)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def latency(fn, rows):
+    timings = np.empty(len(rows))
+    for i, row in enumerate(rows):
+        start = time.perf_counter()
+        fn(row)
+        timings[i] = time.perf_counter() - start
+    return np.percentile(timings, 50) * 1000, np.percentile(timings, 99) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start and latency of the compiled NumPy-only predictor")
+    parser.add_argument('--model', default=str(artifact.default_model_path()),
+                        help="Model bundle directory (a legacy model.pickle is converted to a temporary bundle)")
+    parser.add_argument('--repeat', type=int, default=5, help="Cold starts per path (the fastest is reported)")
+    parser.add_argument('--calls', type=int, default=500, help="Single-row calls to time")
+    parser.add_argument('--rows', type=int, default=100000, help="Batch size for throughput")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The cold starts run from the code directory, so relative paths are resolved first
+        model = Path(args.model).resolve()
+        if model.suffix == '.pickle':
+            legacy = artifact.load_artifact(model)
+            model = Path(tmp) / 'model'
+            artifact.save_artifact(legacy.booster, legacy.pipeline, model)
+
+        orders = generate_orders(max(args.calls, args.rows), seed=5, label=False)
+        order = json.dumps(orders.iloc[0].to_dict(), default=str)
+        print(f"{'path':<20}{'cold start s':>14}{'p50 ms':>9}{'p99 ms':>9}{'rows/sec':>12}")
+
+        reference = predict.Predictor(model, cache_size=0)
+        compiled = compiled_predict.CompiledPredictor(model)
+        single_frames = [orders.iloc[[i]] for i in range(args.calls)]
+        single_records = orders.iloc[:args.calls].to_dict('records')
+        batch = orders.iloc[:args.rows]
+        for name, fn, rows in [('predict.Predictor', reference.predict, single_frames),
+                               ('compiled_predict', compiled.predict, [[record] for record in single_records])]:
+            seconds = cold_start(COLD_START[name], model, order, args.repeat)
+            p50, p99 = latency(fn, rows)
+            start = time.perf_counter()
+            fn(batch if name == 'predict.Predictor' else batch.to_dict('list'))
+            throughput = len(batch) / (time.perf_counter() - start)
+            print(f"{name:<20}{seconds:>14.2f}{p50:>9.2f}{p99:>9.2f}{throughput:>12,.0f}")
+
+        diff = np.abs(reference.predict(batch) - compiled.predict(batch)).max()
+        print(f"\nmax |xgboost - compiled| over {len(batch):,} rows: {diff:g}")
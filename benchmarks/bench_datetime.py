@@ -0,0 +1,83 @@
+from pathlib import Path
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'code'))
+import main  # noqa: E402
+
+
+def legacy_date_and_time_features(df):
+    # extract_date_features + calculate_time_diff as they were before the integer-arithmetic rewrite
+    df["day"] = df.Order_Date.dt.day
+    df["month"] = df.Order_Date.dt.month
+    df["quarter"] = df.Order_Date.dt.quarter
+    df["year"] = df.Order_Date.dt.year
+    df['day_of_week'] = df.Order_Date.dt.day_of_week.astype(int)
+    df["is_month_start"] = df.Order_Date.dt.is_month_start.astype(int)
+    df["is_month_end"] = df.Order_Date.dt.is_month_end.astype(int)
+    df["is_quarter_start"] = df.Order_Date.dt.is_quarter_start.astype(int)
+    df["is_quarter_end"] = df.Order_Date.dt.is_quarter_end.astype(int)
+    df["is_year_start"] = df.Order_Date.dt.is_year_start.astype(int)
+    df["is_year_end"] = df.Order_Date.dt.is_year_end.astype(int)
+    df['is_weekend'] = np.where(df['day_of_week'].isin([5, 6]), 1, 0)
+
+    df['Time_Orderd'] = pd.to_timedelta(df['Time_Orderd'])
+    df['Time_Order_picked'] = pd.to_timedelta(df['Time_Order_picked'])
+    df['Time_Order_picked_formatted'] = df['Order_Date'] + np.where(df['Time_Order_picked'] < df['Time_Orderd'],
+                                                                    pd.DateOffset(days=1), pd.DateOffset(days=0)) + df[
+                                            'Time_Order_picked']
+    df['Time_Ordered_formatted'] = df['Order_Date'] + df['Time_Orderd']
+    df['order_prepare_time'] = (df['Time_Order_picked_formatted'] - df[
+        'Time_Ordered_formatted']).dt.total_seconds() / 60
+    df['order_prepare_time'] = df['order_prepare_time'].fillna(df['order_prepare_time'].median())
+    df.drop(['Time_Orderd', 'Time_Order_picked', 'Time_Ordered_formatted', 'Time_Order_picked_formatted', 'Order_Date'],
+            axis=1, inplace=True)
+    return df
+
+
+def current_date_and_time_features(df):
+    df, _ = main.calculate_time_diff(main.extract_date_features(df))
+    return df
+
+
+def synthetic_times(n, seed=0):
+    rng = np.random.default_rng(seed)
+    ordered = rng.integers(8 * 3600, 24 * 3600, n)
+    picked = (ordered + rng.choice([300, 600, 900], n)) % 86400
+    to_text = np.vectorize(lambda s: f"{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}", otypes=[object])
+    return pd.DataFrame({
+        'Order_Date': pd.Timestamp('2022-02-11') + pd.to_timedelta(rng.integers(0, 60, n), unit='D'),
+        'Time_Orderd': to_text(ordered),
+        'Time_Order_picked': to_text(picked),
+    })
+
+
+def best_of(fn, df, repeat):
+    timings = []
+    for _ in range(repeat):
+        data = df.copy()
+        start = time.perf_counter()
+        result = fn(data)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Date and order-prepare-time feature extraction benchmark")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_times(args.rows)
+    legacy_time, legacy = best_of(legacy_date_and_time_features, df, args.repeat)
+    current_time, current = best_of(current_date_and_time_features, df, args.repeat)
+
+    assert np.allclose(legacy[current.columns].to_numpy(dtype='float64'), current.to_numpy(dtype='float64'))
+    print(f"rows: {args.rows:,}")
+    print(f"legacy:  {legacy_time:.3f}s")
+    print(f"current: {current_time:.3f}s")
+    print(f"speedup: {legacy_time / current_time:.1f}x")
@@ -0,0 +1,45 @@
+from pathlib import Path
+import argparse
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'code'))
+import distance  # noqa: E402
+import geo_index  # noqa: E402
+from synthetic import generate_orders  # noqa: E402
+
+
+def best_of(fn, *args, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distance lookups in the geo index against exact geodesics")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--restaurants', type=int, default=300)
+    parser.add_argument('--resolutions', type=float, nargs='+', default=[geo_index.RESOLUTION, 1e-3, 1e-2])
+    args = parser.parse_args()
+
+    # The index is built from the first fifth of the orders and queried with the rest
+    orders = generate_orders(args.rows, seed=1, restaurants=args.restaurants, null_rate=0)
+    train, test = orders.iloc[:args.rows // 5], orders.iloc[args.rows // 5:]
+    coordinates = [test[column].to_numpy() for column in geo_index.COORDINATE_COLUMNS]
+    exact_time, _ = best_of(distance.distance_km, *coordinates)
+    print(f"exact geodesic: {exact_time:.3f}s for {len(test):,} rows")
+
+    print(f"{'resolution':>12}{'pairs':>9}{'build s':>9}{'lookup s':>10}{'speedup':>9}{'hit rate':>10}"
+          f"{'max err km':>12}{'bound km':>10}{'feature diff':>14}")
+    for resolution in args.resolutions:
+        start = time.perf_counter()
+        index = geo_index.build_geo_index([train], resolution=resolution)
+        build_time = time.perf_counter() - start
+        lookup_time, _ = best_of(index.distance_km, *coordinates)
+        report = geo_index.evaluate(index, test)
+        print(f"{resolution:>12g}{len(index.pair_keys):>9,}{build_time:>9.2f}{lookup_time:>10.3f}"
+              f"{exact_time / lookup_time:>8.1f}x{report['hit_rate']:>10.1%}{report['max_error_km']:>12.2g}"
+              f"{report['error_bound_km']:>10.2g}{report['feature_mismatch_rate']:>14.3%}")
@@ -0,0 +1,123 @@
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'code'))
+import main  # noqa: E402
+import predict  # noqa: E402
+import training  # noqa: E402
+from synthetic import generate_orders  # noqa: E402
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+SIZES = [1, 1000, 100000, 1000000]
+
+
+def measure(fn, *args):
+    # Wall time of a clean run, then peak traced allocation of a second run
+    start = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run_stages(orders, predictor):
+    model = predictor._artifact[0]
+    X = orders.drop(columns=['Time_taken(min)'])
+
+    (cleaned, _), *cleaning_cost = measure(main.cleaning_steps, X)
+    (engineered, _), *engineering_cost = measure(main.perform_feature_engineering, cleaned)
+    (encoded, _), *encoding_cost = measure(main.label_encoding, engineered)
+    _, *standardize_cost = measure(training.standardize, encoded, encoded)
+    features, *pipeline_cost = measure(model.pipeline.transform, X)
+    _, *booster_cost = measure(model.predict, features)
+    _, *predict_cost = measure(predictor.predict, X)
+    return {
+        'cleaning_steps': cleaning_cost,
+        'perform_feature_engineering': engineering_cost,
+        'label_encoding': encoding_cost,
+        'standardize': standardize_cost,
+        'pipeline.transform': pipeline_cost,
+        'model.predict': booster_cost,
+        'predict (end to end)': predict_cost,
+    }
+
+
+def single_row_latency(orders, predictor, calls):
+    X = orders.drop(columns=['Time_taken(min)'])
+    rows = [X.iloc[[i % len(X)]] for i in range(calls)]
+    timings = np.empty(calls)
+    for i, row in enumerate(rows):
+        start = time.perf_counter()
+        predictor.predict(row)
+        timings[i] = time.perf_counter() - start
+    return {'calls': calls, 'p50_ms': np.percentile(timings, 50) * 1000, 'p99_ms': np.percentile(timings, 99) * 1000,
+            'mean_ms': timings.mean() * 1000}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    before = {(r['stage'], r['rows']): r['seconds'] for r in previous['results']}
+    print(f"\nCompared with {previous.get('commit')}:")
+    for r in current['results']:
+        if (r['stage'], r['rows']) in before:
+            print(f"{r['stage']:<30}{r['rows']:>10,}{before[(r['stage'], r['rows'])] / r['seconds']:>9.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time every pipeline stage and prediction on synthetic orders")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--latency-calls', type=int, default=200, help="Single-row predict calls to time")
+    parser.add_argument('--model', default=str(predict.MODEL_PATH), help="Model bundle directory or model.pickle")
+    parser.add_argument('--output', help="JSON file to write (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument('--compare', help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    # The cache would turn repeated benchmark rows into lookups, so measure the uncached path
+    predictor = predict.Predictor(args.model, cache_size=0)
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'results': [],
+    }
+
+    print(f"{'stage':<30}{'rows':>10}{'seconds':>10}{'rows/sec':>14}{'peak MB':>10}")
+    for size in args.sizes:
+        orders = generate_orders(size, seed=size)
+        for stage, (seconds, peak) in run_stages(orders, predictor).items():
+            report['results'].append({'stage': stage, 'rows': size, 'seconds': seconds,
+                                      'rows_per_sec': size / seconds, 'peak_mb': peak / 2 ** 20})
+            print(f"{stage:<30}{size:>10,}{seconds:>10.4f}{size / seconds:>14,.0f}{peak / 2 ** 20:>10.1f}")
+
+    report['single_row_latency'] = single_row_latency(generate_orders(1000, seed=7), predictor, args.latency_calls)
+    latency = report['single_row_latency']
+    print(f"\nsingle-row predict: p50 {latency['p50_ms']:.2f} ms, p99 {latency['p99_ms']:.2f} ms")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+            f"{report['commit'] or 'nogit'}-{report['timestamp'].replace(':', '')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), report)
@@ -0,0 +1,66 @@
+from pathlib import Path
+import argparse
+import itertools
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'code'))
+import predict  # noqa: E402
+from synthetic import generate_orders  # noqa: E402
+
+VEHICLES = ['motorcycle', 'scooter', 'electric_scooter', 'bicycle']
+WEATHER = ['conditions Sunny', 'conditions Cloudy', 'conditions Fog', 'conditions Stormy']
+TRAFFIC = ['Low', 'Medium', 'High', 'Jam']
+
+
+def scenario_fields(riders, pickups):
+    # Candidate riders (vehicle, rating, age) crossed with pickup times, weather and traffic
+    rng = np.random.default_rng(0)
+    minutes = np.linspace(5, 60, pickups).astype(int)
+    return {
+        'Type_of_vehicle': VEHICLES,
+        'Delivery_person_Ratings': np.round(rng.uniform(3.5, 5, riders), 1).tolist(),
+        'Delivery_person_Age': rng.integers(20, 40, riders).tolist(),
+        'Time_Order_picked': [f'{12 + m // 60:02d}:{m % 60:02d}:00' for m in minutes],
+        'Weatherconditions': WEATHER,
+        'Road_traffic_density': TRAFFIC,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="What-if ETA grids: one-row predict calls against predict_grid")
+    parser.add_argument('--model', default=str(predict.MODEL_PATH), help="Model bundle directory or legacy model.pickle")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2, 4, 8], help="Riders and pickup times per grid")
+    parser.add_argument('--max-single-calls', type=int, default=2000,
+                        help="Time at most this many one-row calls and extrapolate beyond")
+    args = parser.parse_args()
+
+    predictor = predict.Predictor(args.model, cache_size=0)
+    base = generate_orders(1, seed=7, label=False, null_rate=0).iloc[0].to_dict()
+    base['Order_Date'] = '12-03-2022'
+    base['Time_Orderd'] = '12:00:00'
+    print(f"{'grid':<8}{'scenarios':>10}{'one-row calls s':>17}{'grid s':>9}{'speedup':>9}{'max diff':>10}")
+    for size in args.sizes:
+        fields = scenario_fields(size, size)
+        # The zipped grid draws as many scenarios as the product has, each field's value picked at random
+        n = int(np.prod([len(values) for values in fields.values()]))
+        rng = np.random.default_rng(size)
+        zipped = {name: [values[i] for i in rng.integers(len(values), size=n)] for name, values in fields.items()}
+        for how, grid_fields in [('product', fields), ('zip', zipped)]:
+            start = time.perf_counter()
+            grid = predictor.predict_grid(base, grid_fields, how).ravel()
+            grid_seconds = time.perf_counter() - start
+
+            combos = (itertools.product(*grid_fields.values()) if how == 'product'
+                      else zip(*grid_fields.values()))
+            rows = [dict(base, **dict(zip(grid_fields, combo))) for combo in combos]
+            timed = rows[:args.max_single_calls]
+            start = time.perf_counter()
+            single = np.array([predictor.predict(pd.DataFrame([row]))[0] for row in timed])
+            single_seconds = (time.perf_counter() - start) * len(rows) / len(timed)
+            diff = np.abs(single - grid[:len(timed)]).max()
+            print(f"{how:<8}{len(rows):>10,}{single_seconds:>17.2f}{grid_seconds:>9.3f}"
+                  f"{single_seconds / grid_seconds:>8.0f}x{diff:>10g}")
@@ -0,0 +1,95 @@
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from synthetic import generate_orders
+
+CODE_DIR = Path(__file__).parents[1] / 'code'
+CONCURRENCY = [1, 16, 64]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(script, port, extra_args):
+    process = subprocess.Popen([sys.executable, script, '--port', str(port), *extra_args], cwd=CODE_DIR,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{script} did not start")
+
+
+async def client(port, bodies, latencies):
+    # One keep-alive connection sending single-order requests back to back
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for body in bodies:
+        start = time.perf_counter()
+        writer.write(f'POST /predict HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+        await writer.drain()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':')[1])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def load(port, bodies, concurrency):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, bodies[i::concurrency], latencies) for i in range(concurrency)))
+    seconds = time.perf_counter() - start
+    latencies = np.array(latencies)
+    return {'requests_per_sec': len(latencies) / seconds, 'p50_ms': np.percentile(latencies, 50) * 1000,
+            'p99_ms': np.percentile(latencies, 99) * 1000}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Single-order request throughput of the threaded and batching servers")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=CONCURRENCY)
+    parser.add_argument('--max-wait-ms', type=float, nargs='+', default=[2, 5])
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    # Distinct orders, so the servers' prediction cache never answers a request
+    orders = generate_orders(args.requests, seed=3, label=False).to_dict('records')
+    bodies = [json.dumps(order).encode() for order in orders]
+    servers = [('server.py', [])] + [
+        ('batch_server.py', ['--max-batch-size', str(args.max_batch_size), '--max-wait-ms', str(wait)])
+        for wait in args.max_wait_ms]
+
+    print(f"{'server':<56}{'clients':>8}{'req/sec':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    for script, extra_args in servers:
+        port = free_port()
+        process = start_server(script, port, extra_args)
+        try:
+            for concurrency in args.concurrency:
+                result = asyncio.run(load(port, bodies, concurrency))
+                name = ' '.join([script] + extra_args)
+                print(f"{name:<56}{concurrency:>8}{result['requests_per_sec']:>10,.0f}{result['p50_ms']:>9.1f}"
+                      f"{result['p99_ms']:>9.1f}")
+        finally:
+            process.terminate()
+            process.wait()
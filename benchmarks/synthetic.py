@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+# Category domains of the Kaggle food delivery dataset, as seen by the shipped model
+CITY_CODES = ['AGR', 'ALH', 'AURG', 'BANG', 'BHP', 'CHEN', 'COIMB', 'DEH', 'GOA', 'HYD', 'INDO', 'JAP', 'KNP', 'KOC',
+              'KOL', 'LUDH', 'MUM', 'MYS', 'PUNE', 'RANCHI', 'SUR', 'VAD']
+WEATHER = ['Cloudy', 'Fog', 'Sandstorms', 'Stormy', 'Sunny', 'Windy']
+TRAFFIC = ['High', 'Jam', 'Low', 'Medium']
+ORDER_TYPES = ['Buffet', 'Drinks', 'Meal', 'Snack']
+VEHICLES = ['bicycle', 'electric_scooter', 'motorcycle', 'scooter']
+CITIES = ['Metropolitian', 'Semi-Urban', 'Urban']
+
+
+def _clock(seconds):
+    seconds = pd.Series(seconds)
+    return (
+        (seconds // 3600).astype(str).str.zfill(2) + ':'
+        + (seconds % 3600 // 60).astype(str).str.zfill(2) + ':'
+        + (seconds % 60).astype(str).str.zfill(2)
+    ).to_numpy(dtype=object)
+
+
+def generate_orders(n, seed=0, null_rate=0.03, label=True, restaurants=None):
+    # Raw orders in the format of data/train.csv, including its 'NaN ' null markers and padded strings.
+    # With restaurants=k, orders come from k fixed restaurants and are delivered 0.01 to 0.13 degrees away
+    # (north-east), the way locations repeat in the Kaggle data; otherwise every coordinate is random.
+    rng = np.random.default_rng(seed)
+
+    def with_nulls(values):
+        values = np.asarray(values, dtype=object)
+        values[rng.random(n) < null_rate] = 'NaN '
+        return values
+
+    if restaurants is None:
+        restaurant_lat = rng.uniform(10, 31, n).round(6)
+        restaurant_lon = rng.uniform(72, 89, n).round(6)
+    else:
+        locations = rng.integers(0, restaurants, n)
+        restaurant_lat = rng.uniform(10, 31, restaurants).round(6)[locations]
+        restaurant_lon = rng.uniform(72, 89, restaurants).round(6)[locations]
+        offset = rng.integers(1, 14, n) * 0.01
+        delivery_lat = (restaurant_lat + offset).round(6)
+        delivery_lon = (restaurant_lon + offset).round(6)
+    ordered = rng.integers(8 * 3600, 24 * 3600, n)
+    picked = (ordered + rng.choice([300, 600, 900], n)) % 86400
+    dates = pd.Timestamp('2022-02-11') + pd.to_timedelta(rng.integers(0, 55, n), unit='D')
+    city_codes = rng.choice(CITY_CODES, n).astype(object)
+
+    orders = pd.DataFrame({
+        'ID': pd.Series(np.arange(n)).map('0x{:04x} '.format).to_numpy(),
+        'Delivery_person_ID': city_codes + 'RES' + pd.Series(rng.integers(1, 21, n)).astype(str).str.zfill(2).to_numpy()
+                              + 'DEL0' + rng.integers(1, 4, n).astype(str) + ' ',
+        'Delivery_person_Age': with_nulls(rng.integers(20, 40, n).astype(str)),
+        'Delivery_person_Ratings': with_nulls(rng.choice(['4.9', '4.8', '4.7', '4.6', '4.5', '4.2', '3.9'], n)),
+        'Restaurant_latitude': restaurant_lat,
+        'Restaurant_longitude': restaurant_lon,
+        'Delivery_location_latitude': (restaurant_lat + rng.uniform(-0.15, 0.15, n)).round(6)
+        if restaurants is None else delivery_lat,
+        'Delivery_location_longitude': (restaurant_lon + rng.uniform(-0.15, 0.15, n)).round(6)
+        if restaurants is None else delivery_lon,
+        'Order_Date': dates.strftime('%d-%m-%Y'),
+        'Time_Orderd': with_nulls(_clock(ordered)),
+        'Time_Order_picked': _clock(picked),
+        'Weatherconditions': 'conditions ' + pd.Series(with_nulls(rng.choice(WEATHER, n))).str.strip().to_numpy(),
+        'Road_traffic_density': with_nulls(rng.choice(TRAFFIC, n).astype(object) + ' '),
+        'Vehicle_condition': rng.integers(0, 3, n),
+        'Type_of_order': rng.choice(ORDER_TYPES, n).astype(object) + ' ',
+        'Type_of_vehicle': rng.choice(VEHICLES, n).astype(object) + ' ',
+        'multiple_deliveries': with_nulls(rng.choice(['0', '1', '2', '3'], n, p=[0.3, 0.6, 0.07, 0.03])),
+        'Festival': with_nulls(rng.choice(['No ', 'Yes '], n, p=[0.98, 0.02])),
+        'City': with_nulls(rng.choice(CITIES, n).astype(object) + ' '),
+    })
+    if label:
+        orders['Time_taken(min)'] = '(min) ' + pd.Series(rng.integers(10, 55, n)).astype(str).to_numpy()
+    return orders
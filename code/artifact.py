@@ -0,0 +1,167 @@
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import threading
+
+import xgboost as xgb
+
+import compiled_predict
+from features import MANIFEST, MODEL_DIR
+from geo_index import GeoIndex
+import metrics
+from pipeline import FeaturePipeline
+
+FORMAT_VERSION = 1
+LEGACY_MODEL_PATH = Path(__file__).parents[1] / 'code/model.pickle'
+GEO_INDEX_SUFFIX = '.geo.npz'
+
+
+class ArtifactError(ValueError):
+    pass
+
+
+class Artifact:
+    # A loaded model bundle. The manifest and feature pipeline are read eagerly (a few KB of JSON);
+    # the booster is only deserialized on first access.
+    def __init__(self, manifest, pipeline, booster_path=None, booster=None):
+        self.manifest = manifest
+        self.pipeline = pipeline
+        self._booster_path = booster_path
+        self._booster = booster
+        self._lock = threading.Lock()
+
+    @property
+    def booster(self):
+        if self._booster is None:
+            with self._lock:
+                if self._booster is None:
+                    with metrics.stage('artifact.booster_load'):
+                        self._booster = _load_booster(self._booster_path, self.manifest)
+        return self._booster
+
+    def predict(self, features):
+        return self.booster.inplace_predict(features)
+
+
+def _sha256(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def _load_booster(path, manifest):
+    if _sha256(path) != manifest['booster']['sha256']:
+        raise ArtifactError(f"{path} does not match the hash recorded in its manifest")
+    booster = xgb.Booster()
+    booster.load_model(str(path))
+    if booster.num_features() != len(manifest['feature_names']):
+        raise ArtifactError(f"Booster expects {booster.num_features()} features but the manifest lists "
+                            f"{len(manifest['feature_names'])}")
+    return booster
+
+
+def manifest_path(path):
+    path = Path(path)
+    return path / MANIFEST if path.is_dir() else path
+
+
+def _write_content_addressed(path, prefix, suffix, raw):
+    digest = hashlib.sha256(raw).hexdigest()
+    name = f'{prefix}-{digest[:16]}{suffix}'
+    (path / name).write_bytes(raw)
+    return {'file': name, 'sha256': digest}
+
+
+def save_artifact(model, pipeline, path=MODEL_DIR, geo_index=None):
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+
+    # Data files are named after their content, so replacing the manifest (atomically, last) switches
+    # readers from one complete model to the next without ever pairing a manifest with the wrong booster
+    previous = json.loads((path / MANIFEST).read_text()) if (path / MANIFEST).exists() else {}
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'xgboost_version': xgb.__version__,
+        'feature_names': [str(name) for name in pipeline.feature_names_in_],
+        'booster': _write_content_addressed(path, 'booster', '.ubj', booster.save_raw(raw_format='ubj')),
+        'pipeline': pipeline.to_dict(),
+        # The trees as flat arrays for compiled_predict, the NumPy-only inference path
+        'compiled': _write_content_addressed(path, 'compiled', '.npz', compiled_predict.compile_booster(booster)),
+    }
+    if geo_index is not None:
+        manifest['geo_index'] = _write_content_addressed(path, 'geo', '.npz', geo_index.to_bytes())
+    tmp = path / (MANIFEST + '.tmp')
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, path / MANIFEST)
+
+    # Readers that loaded the previous manifest load its booster lazily, so the previous generation's files are
+    # kept until the next save; only older ones are removed
+    current = {manifest[key]['file'] for key in ('booster', 'compiled', 'geo_index') if key in manifest}
+    current |= {previous[key]['file'] for key in ('booster', 'compiled', 'geo_index') if key in previous}
+    for old in list(path.glob('booster-*.ubj')) + list(path.glob('compiled-*.npz')) + list(path.glob('geo-*.npz')):
+        if old.name not in current:
+            old.unlink()
+    return manifest
+
+
+def save_geo_index(geo_index, path=MODEL_DIR):
+    # Store a geo index with an existing bundle, or next to a legacy pickle as <name>.geo.npz
+    path = Path(path)
+    if path.suffix == '.pickle':
+        path.with_suffix(GEO_INDEX_SUFFIX).write_bytes(geo_index.to_bytes())
+        return None
+    model = load_artifact(path)
+    return save_artifact(model.booster, model.pipeline, path, geo_index)
+
+
+def load_artifact(path=MODEL_DIR):
+    path = Path(path)
+    if path.suffix == '.pickle':
+        return _load_legacy(path)
+
+    manifest = json.loads(manifest_path(path).read_text())
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ArtifactError(f"Unsupported model format version {manifest.get('format_version')!r}, "
+                            f"expected {FORMAT_VERSION}")
+    pipeline = FeaturePipeline.from_dict(manifest['pipeline'])
+    if list(pipeline.feature_names_in_) != manifest['feature_names']:
+        raise ArtifactError("Feature order of the pipeline does not match the manifest")
+    if 'geo_index' in manifest:
+        raw = (path / manifest['geo_index']['file']).read_bytes()
+        if hashlib.sha256(raw).hexdigest() != manifest['geo_index']['sha256']:
+            raise ArtifactError(f"{manifest['geo_index']['file']} does not match the hash recorded in its manifest")
+        pipeline.set_geo_index(GeoIndex.from_bytes(raw))
+    return Artifact(manifest, pipeline, booster_path=path / manifest['booster']['file'])
+
+
+def _load_legacy(path):
+    # Pickled (model, pipeline) or older (model, label_encoders, scaler) tuples
+    with open(path, 'rb') as f:
+        loaded = pickle.load(f)
+    if len(loaded) == 3:
+        model, label_encoders, scaler = loaded
+        pipeline = FeaturePipeline.from_fitted(label_encoders, scaler)
+    else:
+        model, pipeline = loaded
+    geo_index_path = path.with_suffix(GEO_INDEX_SUFFIX)
+    if geo_index_path.exists():
+        pipeline.set_geo_index(GeoIndex.from_bytes(geo_index_path.read_bytes()))
+    manifest = {'format_version': None, 'feature_names': [str(name) for name in pipeline.feature_names_in_]}
+    return Artifact(manifest, pipeline, booster=model.get_booster())
+
+
+def default_model_path():
+    return MODEL_DIR if (MODEL_DIR / MANIFEST).exists() else LEGACY_MODEL_PATH
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a pickled model into a versioned model bundle")
+    parser.add_argument('pickle', nargs='?', default=str(LEGACY_MODEL_PATH))
+    parser.add_argument('output', nargs='?', default=str(MODEL_DIR))
+    args = parser.parse_args()
+
+    legacy = _load_legacy(Path(args.pickle))
+    save_artifact(legacy.booster, legacy.pipeline, args.output)
+    print(f"Saved model bundle to {args.output}")
@@ -0,0 +1,210 @@
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import json
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import predict
+from server import health, parse_grid, parse_orders
+
+MAX_BATCH_SIZE = 256
+MAX_WAIT_MS = 5
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+
+def _resolve(future, result=None, error=None):
+    # The caller may have gone away (cancelling its future) while the batch was being scored
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class MicroBatcher:
+    # Coalesces concurrent predict requests into one DataFrame and one model call. A batch is flushed once it
+    # holds max_batch_size orders or its oldest request has waited max_wait_ms. Requests that arrive while a
+    # batch is being scored queue up and form the next batch, so batches grow with load.
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = asyncio.Queue()
+        # A single scoring thread keeps the event loop responsive and scores batches one at a time
+        self._executor = ThreadPoolExecutor(1)
+
+    async def predict(self, orders):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        await self._queue.put((orders, future, loop.time()))
+        return await future
+
+    async def call(self, fn, *args):
+        # Work that is not batched (what-if grids are one model call already) runs on the same scoring thread
+        return await asyncio.get_running_loop().run_in_executor(self._executor, _profiled_call, fn, *args)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0][0])
+            deadline = batch[0][2] + self.max_wait
+            while size < self.max_batch_size:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                batch.append(item)
+                size += len(item[0])
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            pred = await loop.run_in_executor(self._executor, self._predict_batch, [orders for orders, _, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                _resolve(batch[0][1], error=e)
+                return
+            # One malformed request must not fail the others it was batched with, so score them separately
+            for orders, future, _ in batch:
+                try:
+                    _resolve(future, await loop.run_in_executor(self._executor, self._predict_batch, [orders]))
+                except Exception as e:
+                    _resolve(future, error=e)
+            return
+
+        offsets = np.cumsum([0] + [len(orders) for orders, _, _ in batch])
+        for (_, future, _), start, end in zip(batch, offsets[:-1], offsets[1:]):
+            _resolve(future, pred[start:end])
+
+    def _predict_batch(self, requests):
+        records = [order for orders in requests for order in orders]
+        with metrics.profile_section(), metrics.stage('server.batch', len(records)):
+            return self.predict_fn(pd.DataFrame.from_records(records))
+
+
+def _profiled_call(fn, *args):
+    with metrics.profile_section():
+        return fn(*args)
+
+
+def _response(status, body, content_type='application/json', keep_alive=True):
+    head = (f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+    return head.encode('latin-1') + body
+
+
+def make_connection_handler(predictor, batcher):
+    async def route(method, path, body):
+        if method == 'GET' and path == '/health':
+            return 200, json.dumps(health(predictor)).encode(), 'application/json'
+        if method == 'GET' and path == '/metrics':
+            return 200, metrics.prometheus_text().encode(), 'text/plain; version=0.0.4'
+        if method == 'GET' and path == '/stats':
+            stats = {'enabled': metrics.is_enabled(), 'stages': metrics.snapshot()}
+            return 200, json.dumps(stats).encode(), 'application/json'
+        if method == 'POST' and path == '/predict':
+            try:
+                orders = parse_orders(body)
+                pred = await batcher.predict(orders) if orders else []
+            except (ValueError, KeyError, TypeError) as e:
+                return 400, json.dumps({'error': str(e)}).encode(), 'application/json'
+            except Exception as e:
+                return 500, json.dumps({'error': str(e)}).encode(), 'application/json'
+            return 200, json.dumps({'predictions': [float(p) for p in pred]}).encode(), 'application/json'
+        if method == 'POST' and path == '/predict_grid':
+            try:
+                pred = await batcher.call(predictor.predict_grid, *parse_grid(body))
+            except (ValueError, KeyError, TypeError) as e:
+                return 400, json.dumps({'error': str(e)}).encode(), 'application/json'
+            except Exception as e:
+                return 500, json.dumps({'error': str(e)}).encode(), 'application/json'
+            return 200, json.dumps({'predictions': pred.tolist()}).encode(), 'application/json'
+        return 404, json.dumps({'error': 'not found'}).encode(), 'application/json'
+
+    async def handle(reader, writer):
+        # Minimal HTTP/1.1 with keep-alive: a request line, headers and a Content-Length body
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload, content_type = await route(method, path, body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                writer.write(_response(status, payload, content_type, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(host='127.0.0.1', port=8000, model_path=predict.MODEL_PATH, max_batch_size=MAX_BATCH_SIZE,
+                max_wait_ms=MAX_WAIT_MS):
+    predictor = predict.Predictor(model_path)
+    batcher = MicroBatcher(predictor.predict, max_batch_size, max_wait_ms)
+    server = await asyncio.start_server(make_connection_handler(predictor, batcher), host, port)
+    print(f"Serving batched predictions on http://{host}:{port}/predict "
+          f"(max batch {max_batch_size} orders, max wait {max_wait_ms} ms)")
+    batching = asyncio.create_task(batcher.run())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batching.cancel()
+
+
+def run_server(args):
+    try:
+        asyncio.run(serve(args.host, args.port, args.model, args.max_batch_size, args.max_wait_ms))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Asyncio scoring endpoint that micro-batches concurrent requests")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--model', default=str(predict.MODEL_PATH), help="Model bundle directory or legacy model.pickle")
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE, help="Orders per model call")
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS,
+                        help="Longest a request waits for others to batch with")
+    parser.add_argument('--metrics', action='store_true', help="Record per-stage latency for /metrics and /stats")
+    parser.add_argument('--profile', help="Profile the event loop and scoring thread until shutdown into this cProfile "
+                                          "stats file")
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable()
+    if args.profile:
+        # Batches are scored on the executor's thread, outside the event loop's
+        with metrics.profiled(args.profile, threads=True):
+            run_server(args)
+    else:
+        run_server(args)
@@ -0,0 +1,144 @@
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+import metrics
+
+CACHE_SIZE = 10000
+CACHE_TTL = 3600
+
+
+class LRUCache:
+    # Thread-safe least-recently-used cache whose entries also expire ttl seconds after being stored
+    def __init__(self, capacity=10000, ttl=None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[1] < self.ttl):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'capacity': self.capacity,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedPredictor:
+    # Holds a loaded model in memory and reloads it only when its manifest changes on disk. The model is swapped
+    # as a single tuple so concurrent predict() calls always see a consistent (model, digest) pair.
+    # Predictions are memoized per engineered feature vector; cache_size=0 disables the cache.
+    # Subclasses name the manifest to watch and load, transform and score with their model.
+    def __init__(self, path, cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL):
+        self.path = path
+        self.cache = LRUCache(cache_size, cache_ttl) if cache_size else None
+        self._lock = threading.Lock()
+        self._stat = None
+        self._digest = None
+        self._artifact = None
+        self.reload()
+
+    @property
+    def digest(self):
+        return self._digest
+
+    def _manifest_path(self):
+        raise NotImplementedError
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _transform(self, model, X):
+        raise NotImplementedError
+
+    def _score(self, model, features):
+        raise NotImplementedError
+
+    def _file_stat(self):
+        stat = os.stat(self._manifest_path())
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, force=False):
+        stat = self._file_stat()
+        if not force and stat == self._stat:
+            return False
+        with self._lock:
+            if not force and stat == self._stat:
+                return False
+            with open(self._manifest_path(), 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            self._stat = stat
+            if not force and digest == self._digest:
+                return False
+            with metrics.stage('predict.load'):
+                self._artifact = self._load(), digest
+            self._digest = digest
+            if self.cache is not None:
+                self.cache.clear()
+            return True
+
+    @metrics.timed('predict')
+    def predict(self, X):
+        with metrics.stage('predict.reload_check'):
+            self.reload()
+        model, digest = self._artifact
+        features = self._transform(model, X)
+        if self.cache is None:
+            with metrics.stage('predict.model', len(features)):
+                return self._score(model, features)
+
+        # Keys carry the model digest so results computed by a model that was swapped out mid-call never leak
+        keys = [(digest, row.tobytes()) for row in features]
+        pred = np.empty(len(keys), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            value = self.cache.get(key)
+            if value is None:
+                missing.append(i)
+            else:
+                pred[i] = value
+        if missing:
+            with metrics.stage('predict.model', len(missing)):
+                pred[missing] = self._score(model, features[missing])
+            for i in missing:
+                self.cache.put(keys[i], pred[i])
+        return pred
@@ -0,0 +1,270 @@
+from collections import Counter
+from pathlib import Path
+import argparse
+import hashlib
+import io
+import json
+import math
+import threading
+import time
+
+import numpy as np
+
+from cache import CACHE_SIZE, CACHE_TTL, CachedPredictor
+import distance
+import features
+from features import CATEGORICAL_COLUMNS, MANIFEST, MODEL_DIR, NUMERIC_COLUMNS
+
+# NumPy-only inference from a model bundle: the booster's trees compiled into flat arrays and the feature
+# pipeline replayed from the manifest, without pandas, scikit-learn or xgboost. Start-up costs little more
+# than importing NumPy, which is what scoring workers and serverless cold starts pay for.
+
+# Rows walked through the trees at a time, bounding the (rows x trees) temporaries
+CHUNKSIZE = 65536
+SUPPORTED_OBJECTIVES = ('reg:squarederror', 'reg:absoluteerror', 'reg:pseudohubererror')
+
+_unknown_counts_lock = threading.Lock()
+
+
+def compile_booster(booster):
+    # Flatten every tree of an xgboost Booster into shared node arrays, saved as .npz bytes. Child indices are
+    # global and leaves point to themselves, so a fixed number of steps walks any row to its leaf.
+    model = json.loads(booster.save_raw(raw_format='json'))['learner']
+    if model['objective']['name'] not in SUPPORTED_OBJECTIVES:
+        raise ValueError(f"Cannot compile a booster with objective {model['objective']['name']!r}")
+    if model['gradient_booster']['name'] != 'gbtree':
+        raise ValueError(f"Cannot compile a {model['gradient_booster']['name']} booster")
+
+    roots, feature, threshold, default_left, left, right, value = [], [], [], [], [], [], []
+    depth = 0
+    offset = 0
+    for tree in model['gradient_booster']['model']['trees']:
+        if any(tree['split_type']):
+            raise ValueError("Cannot compile categorical splits")
+        tree_left = np.asarray(tree['left_children'], dtype=np.int64)
+        tree_right = np.asarray(tree['right_children'], dtype=np.int64)
+        leaf = tree_left == -1
+        own = np.arange(len(tree_left)) + offset
+        roots.append(offset)
+        feature.append(np.where(leaf, 0, tree['split_indices']))
+        threshold.append(tree['split_conditions'])
+        default_left.append(tree['default_left'])
+        left.append(np.where(leaf, own, tree_left + offset))
+        right.append(np.where(leaf, own, tree_right + offset))
+        # Leaves keep their value in split_conditions
+        value.append(np.where(leaf, tree['split_conditions'], 0))
+        depth = max(depth, _tree_depth(tree_left, tree_right))
+        offset += len(tree_left)
+
+    buffer = io.BytesIO()
+    np.savez(buffer, base_score=np.float32(model['learner_model_param']['base_score'].strip('[]')),
+             num_feature=int(model['learner_model_param']['num_feature']), depth=depth,
+             roots=np.asarray(roots, dtype=np.int64), feature=np.concatenate(feature).astype(np.int32),
+             threshold=np.concatenate(threshold).astype(np.float32),
+             default_left=np.concatenate(default_left).astype(bool), left=np.concatenate(left).astype(np.int32),
+             right=np.concatenate(right).astype(np.int32), value=np.concatenate(value).astype(np.float32))
+    return buffer.getvalue()
+
+
+def _tree_depth(left, right):
+    depth = 0
+    level = [0]
+    while level:
+        level = [child for node in level for child in (left[node], right[node]) if child != -1]
+        depth += bool(level)
+    return depth
+
+
+class CompiledTrees:
+    def __init__(self, arrays):
+        self.base_score = np.float32(arrays['base_score'])
+        self.num_feature = int(arrays['num_feature'])
+        self.depth = int(arrays['depth'])
+        self.roots = arrays['roots']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.default_left = arrays['default_left']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.value = arrays['value']
+
+    def predict(self, X, chunksize=CHUNKSIZE):
+        X = np.asarray(X, dtype=np.float32)
+        if len(X) <= chunksize:
+            return self._predict(X)
+        return np.concatenate([self._predict(X[start:start + chunksize]) for start in range(0, len(X), chunksize)])
+
+    def _predict(self, X):
+        # Walk every (row, tree) pair one level per step, with xgboost's rules: go left when value < threshold,
+        # missing values take the default branch. Leaves are summed tree by tree in float32, like xgboost.
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.depth):
+            values = X[rows, self.feature[node]]
+            go_left = np.where(np.isnan(values), self.default_left[node], values < self.threshold[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+        leaves = self.value[node]
+        pred = np.full(len(X), self.base_score, dtype=np.float32)
+        for tree in range(leaves.shape[1]):
+            pred += leaves[:, tree]
+        return pred
+
+
+def _column(orders, name):
+    values = orders[name]
+    return np.asarray(values.to_numpy() if hasattr(values, 'to_numpy') else values, dtype=object)
+
+
+def _text(value):
+    return value if isinstance(value, str) else None
+
+
+def _to_float(value):
+    # float() takes the same strings pandas' astype('float64') does, 'NaN ' included; None is missing
+    return math.nan if value is None else float(value)
+
+
+def _order_date(value):
+    if isinstance(value, str):
+        day, month, year = value.strip().split('-')
+        return f'{int(year):04d}-{int(month):02d}-{int(day):02d}'
+    return np.datetime64(value, 'D')
+
+
+class CompiledPredictor:
+    # Scores raw orders (a DataFrame, a dict of columns or a list of order dicts with the columns of
+    # data/train.csv) with the same features as pipeline.FeaturePipeline and the same trees as the booster.
+    # Geo index lookups are not used: distances are computed, which gives the identical values.
+    def __init__(self, path=MODEL_DIR):
+        path = Path(path)
+        manifest = json.loads((path / MANIFEST).read_text())
+        if 'compiled' not in manifest:
+            raise ValueError(f"{path} has no compiled trees; re-save it with artifact.save_artifact")
+        raw = (path / manifest['compiled']['file']).read_bytes()
+        if hashlib.sha256(raw).hexdigest() != manifest['compiled']['sha256']:
+            raise ValueError(f"{manifest['compiled']['file']} does not match the hash recorded in its manifest")
+        with np.load(io.BytesIO(raw), allow_pickle=False) as arrays:
+            self.trees = CompiledTrees(arrays)
+
+        state = manifest['pipeline']
+        self.feature_names = state['feature_names']
+        if len(self.feature_names) != self.trees.num_feature:
+            raise ValueError(f"Trees expect {self.trees.num_feature} features but the manifest lists "
+                             f"{len(self.feature_names)}")
+        self.params = state['params']
+        self.codes = {column: {value: code for code, value in enumerate(classes)}
+                      for column, classes in state['categories'].items()}
+        self.mean = np.asarray(state['mean'], dtype='float64')
+        self.scale = np.asarray(state['scale'], dtype='float64')
+        self.null_values = state['null_values']
+        # Values not seen during fit, per column, as FeaturePipeline.unknown_counts_ counts them
+        self.unknown_counts_ = Counter()
+
+    def transform(self, orders):
+        if isinstance(orders, list):
+            orders = {name: [order.get(name) for order in orders] for name in orders[0]} if orders else {}
+        columns = self._feature_columns(orders)
+        out = np.empty((len(columns['distance']), len(self.feature_names)), dtype=np.float32)
+        for i, name in enumerate(self.feature_names):
+            values = columns[name]
+            if name in self.codes:
+                values = self._encode(name, values)
+            out[:, i] = (np.asarray(values, dtype='float64') - self.mean[i]) / self.scale[i]
+        return out
+
+    def predict(self, orders):
+        return self.trees.predict(self.transform(orders))
+
+    def _encode(self, column, values):
+        codes = self.codes[column]
+        unknown = self.params['unknown_value']
+        if unknown == 'raise':
+            unseen = sorted({value for value in values if value not in codes}, key=str)
+            if unseen:
+                raise ValueError(f"{column} contains previously unseen labels: {unseen}")
+        encoded = [codes.get(value) for value in values]
+        unseen = encoded.count(None)
+        if unseen:
+            with _unknown_counts_lock:
+                self.unknown_counts_[column] += unseen
+            encoded = [unknown if code is None else code for code in encoded]
+        return np.array(encoded, dtype='float64')
+
+    def _feature_columns(self, orders):
+        # Raw values read 'conditions Sunny'; those of the cleaned column name are the weather itself
+        if 'Weatherconditions' in orders:
+            weather = [features.weather_condition(value) for value in _column(orders, 'Weatherconditions')]
+        else:
+            weather = _column(orders, 'Weather_conditions')
+        text = {
+            'Weather_conditions': weather,
+            'City_code': [_text(value) and value.split('RES')[0] for value in _column(orders, 'Delivery_person_ID')],
+        }
+        columns = {}
+        for column in CATEGORICAL_COLUMNS:
+            values = text[column] if column in text else _column(orders, column)
+            values = [_text(value) and value.strip() for value in values]
+            fill = self.null_values.get(column)
+            columns[column] = [fill if value is None or 'NaN' in value else value for value in values]
+        for column in NUMERIC_COLUMNS:
+            values = _column(orders, column)
+            try:
+                values = values.astype('float64')
+            except TypeError:
+                values = np.array([_to_float(value) for value in values], dtype='float64')
+            if column in self.null_values:
+                values[np.isnan(values)] = self.null_values[column]
+            columns[column] = values
+
+        # Orders share few dates, so each distinct one is parsed once
+        order_date = _column(orders, 'Order_Date')
+        parsed = {value: _order_date(value) for value in set(order_date.tolist())}
+        order_date = np.array([parsed[value] for value in order_date], dtype='datetime64[D]')
+        columns.update(features.date_features(order_date))
+        prepare_time = np.mod(features.time_to_seconds(_column(orders, 'Time_Order_picked'))
+                              - features.time_to_seconds(_column(orders, 'Time_Orderd')), 86400) / 60
+        prepare_time[np.isnan(prepare_time)] = self.null_values['order_prepare_time']
+        columns['order_prepare_time'] = prepare_time
+
+        km = distance.distance_km(columns['Restaurant_latitude'], columns['Restaurant_longitude'],
+                                  columns['Delivery_location_latitude'], columns['Delivery_location_longitude'],
+                                  method=self.params['distance_method'])
+        precision = self.params['distance_precision']
+        if precision is not None:
+            km = np.floor(km * 10 ** precision) / 10 ** precision
+        columns['distance'] = km
+        return columns
+
+
+class ReloadingPredictor(CachedPredictor):
+    # CompiledPredictor for long-running processes: like predict.Predictor it reloads the bundle when its manifest
+    # changes on disk and memoizes predictions per feature vector, still without pandas or xgboost.
+    def __init__(self, path=MODEL_DIR, cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL):
+        super().__init__(Path(path), cache_size, cache_ttl)
+
+    def unknown_counts(self):
+        return dict(self._artifact[0].unknown_counts_)
+
+    def _manifest_path(self):
+        return self.path / MANIFEST
+
+    def _load(self):
+        return CompiledPredictor(self.path)
+
+    def _transform(self, model, X):
+        return model.transform(X)
+
+    def _score(self, model, features):
+        return model.trees.predict(features)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a JSON file of orders with the NumPy-only compiled model")
+    parser.add_argument('input', help="JSON file holding a list of orders with the columns of data/train.csv")
+    parser.add_argument('--model', default=str(MODEL_DIR), help="Model bundle directory")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    predictor = CompiledPredictor(args.model)
+    pred = predictor.predict(json.loads(Path(args.input).read_text()))
+    print(json.dumps({'predictions': pred.tolist(), 'seconds': time.perf_counter() - start}))
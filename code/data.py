@@ -0,0 +1,148 @@
+from pathlib import Path
+import hashlib
+import json
+
+TRAIN_CSV = Path(__file__).parents[1] / 'data/train.csv'
+SNAPSHOT_DIR = Path(__file__).parents[1] / 'data/cache'
+UI_METADATA_PATH = Path(__file__).parents[1] / 'code/ui_metadata.json'
+# pandas and main are imported by the functions that use them, so reading the UI metadata stays cheap for the
+# Streamlit app
+
+# Null markers in the raw CSV carry a trailing space, so they are not caught by the default na_values
+NA_VALUES = ['NaN', 'NaN ']
+
+# Model inputs stay float64: serving sends float64 values, and float32 ones (4.9 -> 4.900000095) would fall on the
+# other side of split thresholds than the values the model is served
+CSV_DTYPES = {
+    'ID': 'str',
+    'Delivery_person_ID': 'str',
+    'Delivery_person_Age': 'float64',
+    'Delivery_person_Ratings': 'float64',
+    'Restaurant_latitude': 'float64',
+    'Restaurant_longitude': 'float64',
+    'Delivery_location_latitude': 'float64',
+    'Delivery_location_longitude': 'float64',
+    'Order_Date': 'category',
+    'Time_Orderd': 'category',
+    'Time_Order_picked': 'category',
+    'Weatherconditions': 'category',
+    'Road_traffic_density': 'category',
+    'Vehicle_condition': 'int8',
+    'Type_of_order': 'category',
+    'Type_of_vehicle': 'category',
+    'multiple_deliveries': 'float64',
+    'Festival': 'category',
+    'City': 'category',
+    'Time_taken(min)': 'category',
+}
+
+# Compact dtypes for the cleaned snapshot, which only feeds the UI metadata; every remaining text column becomes a
+# category
+CLEAN_DTYPES = {
+    'Delivery_person_Age': 'float32',
+    'Delivery_person_Ratings': 'float32',
+    'Vehicle_condition': 'int8',
+    'multiple_deliveries': 'int8',
+    'Time_taken(min)': 'int8',
+}
+
+
+def read_train_csv(path=TRAIN_CSV, **kwargs):
+    import pandas as pd
+
+    return pd.read_csv(path, dtype=CSV_DTYPES, na_values=NA_VALUES, **kwargs)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def clean_train(df):
+    import main
+
+    df, _ = main.cleaning_steps(df)
+    if 'Time_taken(min)' in df:
+        df = main.extract_label_value(df)
+    df = df.astype({column: dtype for column, dtype in CLEAN_DTYPES.items() if column in df})
+    for column in df.select_dtypes(include='object').columns:
+        df[column] = df[column].astype('category')
+    return df
+
+
+def load_clean_train(path=TRAIN_CSV, snapshot_dir=SNAPSHOT_DIR):
+    # Parse & clean the CSV once and keep a Parquet snapshot keyed by the CSV's content hash
+    snapshot = Path(snapshot_dir) / f'{Path(path).stem}-{file_digest(path)[:16]}.parquet'
+    if snapshot.exists():
+        import pandas as pd
+        return pd.read_parquet(snapshot)
+
+    df = clean_train(read_train_csv(path))
+    snapshot.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(snapshot, index=False)
+    return df
+
+
+def bounded_map(fn, items, workers):
+    # Like executor.map over argument tuples, but only a couple of items per worker are in flight, so chunked
+    # passes over large files keep memory flat
+    if workers <= 1:
+        for item in items:
+            yield fn(*item)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = []
+        for item in items:
+            pending.append(executor.submit(fn, *item))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+# Columns of the cleaned training frame the Streamlit app offers as choices, as integer choices, and as ranges
+UI_TEXT_COLUMNS = ['Type_of_order', 'Type_of_vehicle', 'City_code', 'City', 'Road_traffic_density',
+                   'Weather_conditions', 'Festival']
+UI_INTEGER_COLUMNS = ['multiple_deliveries', 'Vehicle_condition']
+UI_RANGE_COLUMNS = ['Delivery_person_Age', 'Delivery_person_Ratings']
+
+
+def build_ui_metadata(df):
+    # Widget domains & ranges for the Streamlit app, taken from a cleaned training frame
+    metadata = {column: [str(value) for value in df[column].unique()] for column in UI_TEXT_COLUMNS}
+    for column in UI_INTEGER_COLUMNS:
+        metadata[column] = sorted(int(value) for value in df[column].unique())
+    # Rounded to drop the float32 noise of the snapshot (4.900000095), which the rating slider would send on
+    for column in UI_RANGE_COLUMNS:
+        metadata[column] = {'min': round(float(df[column].min()), 6), 'max': round(float(df[column].max()), 6),
+                            'mean': round(float(df[column].mean()), 6)}
+    return metadata
+
+
+def ui_metadata_from_counts(counts):
+    # The same domains from {column: Counter of values} over the cleaned training rows, as collected chunk by
+    # chunk by train_chunked.py
+    metadata = {column: [str(value) for value in sorted(counts[column])] for column in UI_TEXT_COLUMNS}
+    for column in UI_INTEGER_COLUMNS:
+        metadata[column] = sorted(int(value) for value in counts[column])
+    for column in UI_RANGE_COLUMNS:
+        values = counts[column]
+        mean = sum(value * count for value, count in values.items()) / sum(values.values())
+        metadata[column] = {'min': round(float(min(values)), 6), 'max': round(float(max(values)), 6),
+                            'mean': round(float(mean), 6)}
+    return metadata
+
+
+def save_ui_metadata(metadata, path=UI_METADATA_PATH):
+    with open(path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+
+def load_ui_metadata(path=UI_METADATA_PATH):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,94 @@
+import numpy as np
+
+# WGS-84 ellipsoid, the same one geopy.distance.geodesic uses by default
+WGS84_A = 6378.137
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+EARTH_RADIUS = 6371.009
+
+METHODS = ('haversine', 'geodesic')
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype='float64')) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def geodesic(lat1, lon1, lat2, lon2, max_iter=200, tol=1e-12):
+    # Vincenty's inverse formula evaluated on whole arrays. Points that have not converged
+    # keep iterating; nearly antipodal pairs that never converge fall back to haversine.
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(v, dtype='float64') for v in (lat1, lon1, lat2, lon2)))
+    L = np.radians(lon2 - lon1)
+    U1 = np.arctan((1 - WGS84_F) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - WGS84_F) * np.tan(np.radians(lat2)))
+    sin_U1, cos_U1 = np.sin(U1), np.cos(U1)
+    sin_U2, cos_U2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    sin_sigma = np.zeros_like(L)
+    cos_sigma = np.ones_like(L)
+    sigma = np.zeros_like(L)
+    cos_sq_alpha = np.ones_like(L)
+    cos_2sigma_m = np.zeros_like(L)
+    active = np.ones(L.shape, dtype=bool)
+
+    for _ in range(max_iter):
+        sin_lam, cos_lam = np.sin(lam[active]), np.cos(lam[active])
+        su1, cu1, su2, cu2 = sin_U1[active], cos_U1[active], sin_U2[active], cos_U2[active]
+        s_sigma = np.hypot(cu2 * sin_lam, cu1 * su2 - su1 * cu2 * cos_lam)
+        c_sigma = su1 * su2 + cu1 * cu2 * cos_lam
+        sig = np.arctan2(s_sigma, c_sigma)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sin_alpha = np.where(s_sigma == 0, 0.0, cu1 * cu2 * sin_lam / s_sigma)
+            c_sq_alpha = 1 - sin_alpha ** 2
+            c_2sm = np.where(c_sq_alpha == 0, 0.0, c_sigma - 2 * su1 * su2 / c_sq_alpha)
+        C = WGS84_F / 16 * c_sq_alpha * (4 + WGS84_F * (4 - 3 * c_sq_alpha))
+        lam_prev = lam[active]
+        lam_new = L[active] + (1 - C) * WGS84_F * sin_alpha * (
+            sig + C * s_sigma * (c_2sm + C * c_sigma * (-1 + 2 * c_2sm ** 2)))
+
+        idx = np.flatnonzero(active)
+        lam[idx], sin_sigma[idx], cos_sigma[idx], sigma[idx] = lam_new, s_sigma, c_sigma, sig
+        cos_sq_alpha[idx], cos_2sigma_m[idx] = c_sq_alpha, c_2sm
+        active[idx] = np.abs(lam_new - lam_prev) > tol
+        if not active.any():
+            break
+
+    u_sq = cos_sq_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    B = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+        - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+    km = WGS84_B * A * (sigma - delta_sigma)
+
+    if active.any():
+        km[active] = haversine(lat1[active], lon1[active], lat2[active], lon2[active])
+    return km
+
+
+def distance_km(lat1, lon1, lat2, lon2, method='geodesic'):
+    if method == 'haversine':
+        return haversine(lat1, lon1, lat2, lon2)
+    if method == 'geodesic':
+        return geodesic(lat1, lon1, lat2, lon2)
+    raise ValueError(f"Unknown distance method {method!r}, expected one of {METHODS}")
+
+
+if __name__ == "__main__":
+    # Tolerance check against geopy on random coordinate pairs
+    from geopy import distance as geopy_distance
+
+    rng = np.random.default_rng(42)
+    n = 2000
+    lat1, lat2 = rng.uniform(-85, 85, n), rng.uniform(-85, 85, n)
+    lon1, lon2 = rng.uniform(-180, 180, n), rng.uniform(-180, 180, n)
+    expected = np.array([geopy_distance.geodesic((a, b), (c, d)).km for a, b, c, d in zip(lat1, lon1, lat2, lon2)])
+
+    geodesic_error = np.abs(geodesic(lat1, lon1, lat2, lon2) - expected)
+    haversine_error = np.abs(haversine(lat1, lon1, lat2, lon2) - expected) / expected
+    print("geodesic max abs error (km):", geodesic_error.max())
+    print("haversine max rel error:", haversine_error.max())
+    assert geodesic_error.max() < 1e-3
+    assert haversine_error.max() < 6e-3
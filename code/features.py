@@ -0,0 +1,101 @@
+from pathlib import Path
+
+import numpy as np
+
+# Feature arithmetic shared by training (main.py, pipeline.py) and the NumPy-only compiled predictor, so
+# this module must not import anything beyond NumPy.
+
+# Raw columns both predictors read features from, and where they find a model bundle
+NUMERIC_COLUMNS = ['Delivery_person_Age', 'Delivery_person_Ratings', 'Restaurant_latitude', 'Restaurant_longitude',
+                   'Delivery_location_latitude', 'Delivery_location_longitude', 'Vehicle_condition',
+                   'multiple_deliveries']
+CATEGORICAL_COLUMNS = ['Weather_conditions', 'Road_traffic_density', 'Type_of_order', 'Type_of_vehicle', 'Festival',
+                       'City', 'City_code']
+MODEL_DIR = Path(__file__).parent / 'model'
+MANIFEST = 'manifest.json'
+
+
+def date_features(order_date):
+    # All calendar features from a single datetime64 conversion, using integer arithmetic on day/month/year units
+    days = np.asarray(order_date, dtype='datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = days.astype('datetime64[Y]')
+    day = (days - months).astype('int64') + 1
+    month = (months - years).astype('int64') + 1
+    day_of_week = (days.astype('int64') + 3) % 7  # 1970-01-01 was a Thursday
+    is_month_start = day == 1
+    is_month_end = (days + 1).astype('datetime64[M]') != months
+    return {
+        'day': day,
+        'month': month,
+        'quarter': (month - 1) // 3 + 1,
+        'year': years.astype('int64') + 1970,
+        'day_of_week': day_of_week,
+        'is_month_start': is_month_start.astype(int),
+        'is_month_end': is_month_end.astype(int),
+        'is_quarter_start': (is_month_start & (month % 3 == 1)).astype(int),
+        'is_quarter_end': (is_month_end & (month % 3 == 0)).astype(int),
+        'is_year_start': (is_month_start & (month == 1)).astype(int),
+        'is_year_end': (is_month_end & (month == 12)).astype(int),
+        'is_weekend': (day_of_week >= 5).astype(int),
+    }
+
+
+def clock_seconds(values):
+    # Seconds since midnight of 'HH:MM:SS' strings, decoded from their character codes. Returns the seconds
+    # (NaN where a value is not of that form) and the mask of well-formed values. The ninth character must be
+    # empty, so longer strings are not cut down to a valid-looking prefix.
+    text = np.asarray(values, dtype=object).astype('U9')
+    codes = text.view(np.uint32).reshape(len(text), 9).astype(np.int64) - ord('0')
+    digits = codes[:, [0, 1, 3, 4, 6, 7]]
+    well_formed = ((digits >= 0) & (digits <= 9)).all(axis=1) & (codes[:, 2] == ord(':') - ord('0')) & (
+            codes[:, 5] == ord(':') - ord('0')) & (codes[:, 8] == -ord('0'))
+    seconds = ((digits[:, 0] * 10 + digits[:, 1]) * 3600 + (digits[:, 2] * 10 + digits[:, 3]) * 60
+               + digits[:, 4] * 10 + digits[:, 5]).astype('float64')
+    seconds[~well_formed] = np.nan
+    return seconds, well_formed
+
+
+def is_missing(value):
+    # None, NaN, NaT, pandas.NA and the raw CSV's 'NaN' markers
+    if isinstance(value, str):
+        return value.strip() in ('', 'NaN')
+    try:
+        return value is None or bool(value != value)
+    except TypeError:
+        return True
+
+
+def weather_condition(value):
+    # The weather of one raw 'conditions <weather>' value, None when it is missing. Other values raise rather
+    # than become a missing weather filled with the training mode.
+    if is_missing(value):
+        return None
+    if not isinstance(value, str) or not value.startswith('conditions '):
+        raise ValueError(f"Weatherconditions {value!r} is not of the form 'conditions <weather>'")
+    return value.split(' ')[1]
+
+
+def clock_value(value):
+    # Seconds since midnight of one 'H:M:S' or 'H:M' value, NaN when it is missing. Anything else raises, so a
+    # malformed time is reported rather than filled with the median prepare time.
+    if is_missing(value):
+        return np.nan
+    parts = value.strip().split(':') if isinstance(value, str) else []
+    try:
+        if len(parts) not in (2, 3):
+            raise ValueError
+        hours, minutes, seconds = (float(part) for part in parts + ['0'] * (3 - len(parts)))
+    except ValueError:
+        raise ValueError(f"Time {value!r} is not in HH:MM:SS or HH:MM format") from None
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def time_to_seconds(values):
+    # Seconds since midnight of time strings (NaN where missing). Well-formed 'HH:MM:SS' values are decoded from
+    # their character codes; the rest go through clock_value one by one.
+    values = np.asarray(values, dtype=object)
+    seconds, well_formed = clock_seconds(values)
+    for i in np.flatnonzero(~well_formed):
+        seconds[i] = clock_value(values[i])
+    return seconds
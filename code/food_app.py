@@ -1,14 +1,36 @@
-from pathlib import Path
 import datetime
+import json
 
-import pandas as pd
 import streamlit as st
 
-import main
-import predict
+import compiled_predict
+import data
 
 
-def get_user_input(df_train):
+@st.cache_resource
+def load_model():
+    # Held across reruns and sessions; both predictors reload the model when it is re-saved and cache
+    # predictions. Bundles score with their compiled trees, which import only NumPy; bundles saved without them
+    # and legacy model.pickle files load pandas, scikit-learn and xgboost through predict.Predictor.
+    manifest = compiled_predict.MODEL_DIR / compiled_predict.MANIFEST
+    if manifest.exists() and 'compiled' in json.loads(manifest.read_text()):
+        return compiled_predict.ReloadingPredictor().predict
+
+    import pandas as pd
+    import predict
+    predictor = predict.get_predictor()
+    return lambda order: predictor.predict(pd.DataFrame(order))
+
+
+@st.cache_resource
+def load_ui_metadata():
+    if data.UI_METADATA_PATH.exists():
+        return data.load_ui_metadata()
+    # Models trained before the metadata file existed: derive it from the training data once
+    return data.build_ui_metadata(data.load_clean_train())
+
+
+def get_user_input(metadata):
     # Order Information Section
     st.markdown("### 🛒 Order Related Information")
     st.markdown("---")
@@ -46,10 +68,10 @@ def get_user_input(df_train):
             pickup_time = (datetime.datetime.now() + datetime.timedelta(minutes=15)).time()
     with col4:
         order_type = st.selectbox('🍕 Type of Order',
-                                  df_train['Type_of_order'].unique())
+                                  metadata['Type_of_order'])
     
     multiple_deliveries = st.selectbox('📦 Combined Deliveries',
-                                       sorted(df_train['multiple_deliveries'].unique().astype('int')),
+                                       metadata['multiple_deliveries'],
                                        help="Number of deliveries combined together")
     
     st.markdown("")
@@ -78,23 +100,23 @@ def get_user_input(df_train):
     col7, col8 = st.columns(2)
     with col7:
         delivery_person_age = st.slider("👤 Age",
-                                        int(df_train['Delivery_person_Age'].min()),
-                                        int(df_train['Delivery_person_Age'].max()),
-                                        int(df_train['Delivery_person_Age'].mean()))
+                                        int(metadata['Delivery_person_Age']['min']),
+                                        int(metadata['Delivery_person_Age']['max']),
+                                        int(metadata['Delivery_person_Age']['mean']))
     with col8:
         delivery_person_rating = st.slider("⭐ Rating",
-                                           float(df_train['Delivery_person_Ratings'].min()),
-                                           float(df_train['Delivery_person_Ratings'].max()),
-                                           float(df_train['Delivery_person_Ratings'].mean()),
+                                           float(metadata['Delivery_person_Ratings']['min']),
+                                           float(metadata['Delivery_person_Ratings']['max']),
+                                           float(metadata['Delivery_person_Ratings']['mean']),
                                            format="%.1f")
     
     col9, col10 = st.columns(2)
     with col9:
         vehicle = st.selectbox('🛵 Vehicle Type',
-                               df_train['Type_of_vehicle'].unique())
+                               metadata['Type_of_vehicle'])
     with col10:
         vehicle_condition = st.selectbox('🔧 Vehicle Condition',
-                                         sorted(df_train['Vehicle_condition'].unique()))
+                                         metadata['Vehicle_condition'])
     
     st.markdown("")
     
@@ -105,10 +127,10 @@ def get_user_input(df_train):
     col11, col12 = st.columns(2)
     with col11:
         city_code = st.selectbox('🏛️ City Name',
-                                 df_train['City_code'].unique())
+                                 metadata['City_code'])
     with col12:
         city = st.selectbox('🌆 City Type',
-                            df_train['City'].unique())
+                            metadata['City'])
     
     st.markdown("")
     
@@ -119,15 +141,16 @@ def get_user_input(df_train):
     col13, col14, col15 = st.columns(3)
     with col13:
         road_density = st.selectbox('🚦 Traffic Density',
-                                    df_train['Road_traffic_density'].unique())
+                                    metadata['Road_traffic_density'])
     with col14:
         weather_conditions = st.selectbox('☁️ Weather',
-                                          df_train['Weather_conditions'].unique())
+                                          metadata['Weather_conditions'])
     with col15:
         festival = st.selectbox('🎉 Festival',
-                                df_train['Festival'].unique())
+                                metadata['Festival'])
 
-    X = pd.DataFrame({
+    # One order as a dict of columns, which both predictors accept
+    X = {column: [value] for column, value in {
         'ID': '123456',
         'Delivery_person_ID': city_code + 'RES13DEL02',
         'Delivery_person_Age': delivery_person_age,
@@ -147,7 +170,7 @@ def get_user_input(df_train):
         'multiple_deliveries': multiple_deliveries,
         'Festival': festival,
         'City': city
-    }, index=[0])
+    }.items()}
     return X
 
 
@@ -280,16 +303,15 @@ if __name__ == "__main__":
         </style>
     """, unsafe_allow_html=True)
 
-    # Read in training data
-    df_train = pd.read_csv(str(Path(__file__).parents[1] / 'data/train.csv'))
-    main.cleaning_steps(df_train)
+    # Load the widget domains saved by the training run
+    metadata = load_ui_metadata()
 
     # Beautiful header
     st.markdown("<h1>🍔 Food Delivery Time Prediction 🚀</h1>", unsafe_allow_html=True)
     st.markdown("<br>", unsafe_allow_html=True)
 
     # Get user input from main screen
-    input_df = get_user_input(df_train)
+    input_df = get_user_input(metadata)
     
     st.markdown("<br>", unsafe_allow_html=True)
 
@@ -305,7 +327,7 @@ if __name__ == "__main__":
         order_pickup_time = input_df['Time_Order_picked'][0]
         order_pickup_date_time = datetime.datetime.strptime(f'{order_date} {order_pickup_time}', '%d-%m-%Y %H:%M:%S')
 
-        total_delivery_minutes = round(predict.predict(input_df)[0], 2)
+        total_delivery_minutes = round(float(load_model()(input_df)[0]), 2)
         minutes = int(total_delivery_minutes)
         seconds = int((total_delivery_minutes - minutes) * 60)
         X = order_pickup_date_time + datetime.timedelta(minutes=minutes, seconds=seconds)
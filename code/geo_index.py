@@ -0,0 +1,176 @@
+import argparse
+import io
+import threading
+
+import numpy as np
+import pandas as pd
+
+import distance
+import main
+
+# Grid cell size in degrees. train.csv stores coordinates with 6 decimals, so the default grid is exact:
+# every distinct coordinate is its own cell and cached distances equal the computed ones bit for bit.
+RESOLUTION = 1e-6
+# Upper bound on the length of one degree of latitude or longitude, for the snapping error bound
+KM_PER_DEGREE = 111.7
+COORDINATE_COLUMNS = ['Restaurant_latitude', 'Restaurant_longitude', 'Delivery_location_latitude',
+                      'Delivery_location_longitude']
+
+
+def snap(lat, lon, resolution=RESOLUTION):
+    # Integer id of the grid cell holding each point; -1 for missing coordinates
+    lat = np.asarray(lat, dtype='float64')
+    lon = np.asarray(lon, dtype='float64')
+    columns = int(round(360 / resolution)) + 1
+    with np.errstate(invalid='ignore'):
+        cells = (np.rint((lat + 90) / resolution).astype(np.int64) * columns
+                 + np.rint((lon + 180) / resolution).astype(np.int64))
+    return np.where(np.isnan(lat) | np.isnan(lon), -1, cells)
+
+
+class GeoIndex:
+    # Distances between restaurant cells and delivery zone cells, precomputed from training orders, plus
+    # per-restaurant aggregates. Cached distances are those of the first order seen in each pair of cells, so
+    # with a grid coarser than the data the error is bounded by error_bound_km(); pairs that are not in the
+    # index are computed exactly.
+    def __init__(self, method, resolution, restaurant_cells, zone_cells, pair_keys, pair_km, restaurant_orders,
+                 restaurant_prepare_time):
+        self.method = method
+        self.resolution = resolution
+        self.restaurant_cells = restaurant_cells
+        self.zone_cells = zone_cells
+        self.pair_keys = pair_keys
+        self.pair_km = pair_km
+        self.restaurant_orders = restaurant_orders
+        self.restaurant_prepare_time = restaurant_prepare_time
+        # Hash tables for the lookups, which beat a binary search over the sorted arrays by a wide margin
+        self._restaurants = pd.Index(restaurant_cells)
+        self._zones = pd.Index(zone_cells)
+        self._pairs = pd.Index(pair_keys)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def error_bound_km(self):
+        # Both ends can sit anywhere in their cells: at most one cell diagonal each
+        return 2 * np.sqrt(2) * self.resolution * KM_PER_DEGREE
+
+    def distance_km(self, lat1, lon1, lat2, lon2):
+        lat1, lon1, lat2, lon2 = (np.asarray(v, dtype='float64') for v in (lat1, lon1, lat2, lon2))
+        restaurant = self._restaurants.get_indexer(snap(lat1, lon1, self.resolution))
+        zone = self._zones.get_indexer(snap(lat2, lon2, self.resolution))
+        pair = self._pairs.get_indexer(np.where((restaurant >= 0) & (zone >= 0),
+                                                restaurant * len(self.zone_cells) + zone, -1))
+        hit = pair >= 0
+
+        km = np.empty(len(lat1), dtype='float64')
+        km[hit] = self.pair_km[pair[hit]]
+        miss = ~hit
+        if miss.any():
+            km[miss] = distance.distance_km(lat1[miss], lon1[miss], lat2[miss], lon2[miss], method=self.method)
+        with self._lock:
+            self.hits += int(hit.sum())
+            self.misses += int(miss.sum())
+        return km
+
+    def restaurant_stats(self, lat, lon):
+        # Historical order count & mean order_prepare_time of the restaurants at these coordinates (NaN if unknown)
+        restaurant = self._restaurants.get_indexer(snap(lat, lon, self.resolution))
+        known = restaurant >= 0
+        orders = np.zeros(len(restaurant), dtype=np.int64)
+        prepare_time = np.full(len(restaurant), np.nan)
+        orders[known] = self.restaurant_orders[restaurant[known]]
+        prepare_time[known] = self.restaurant_prepare_time[restaurant[known]]
+        return pd.DataFrame({'orders': orders, 'mean_order_prepare_time': prepare_time})
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'restaurants': len(self.restaurant_cells), 'zones': len(self.zone_cells),
+                    'pairs': len(self.pair_keys), 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else None, 'error_bound_km': self.error_bound_km()}
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, method=self.method, resolution=self.resolution, restaurant_cells=self.restaurant_cells,
+                 zone_cells=self.zone_cells, pair_keys=self.pair_keys, pair_km=self.pair_km,
+                 restaurant_orders=self.restaurant_orders, restaurant_prepare_time=self.restaurant_prepare_time)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, raw):
+        with np.load(io.BytesIO(raw), allow_pickle=False) as arrays:
+            return cls(str(arrays['method']), float(arrays['resolution']), arrays['restaurant_cells'],
+                       arrays['zone_cells'], arrays['pair_keys'], arrays['pair_km'], arrays['restaurant_orders'],
+                       arrays['restaurant_prepare_time'])
+
+
+def build_geo_index(frames, method=main.DISTANCE_METHOD, resolution=RESOLUTION):
+    # frames: raw order DataFrames (a whole training set or the chunks of a CSV reader)
+    pairs = []
+    restaurants = []
+    for df in frames:
+        coordinates = df[COORDINATE_COLUMNS].astype('float64')
+        restaurant = snap(coordinates['Restaurant_latitude'], coordinates['Restaurant_longitude'], resolution)
+        zone = snap(coordinates['Delivery_location_latitude'], coordinates['Delivery_location_longitude'],
+                    resolution)
+        valid = (restaurant >= 0) & (zone >= 0)
+        chunk = coordinates[valid].assign(restaurant=restaurant[valid], zone=zone[valid])
+        pairs.append(chunk.drop_duplicates(['restaurant', 'zone']))
+
+        prepare_time = main.order_prepare_minutes(df['Time_Orderd'], df['Time_Order_picked'])
+        restaurants.append(pd.DataFrame({'restaurant': restaurant, 'prepare_time': prepare_time})[restaurant >= 0]
+                           .groupby('restaurant')['prepare_time'].agg(['size', 'sum', 'count']))
+
+    pairs = pd.concat(pairs).drop_duplicates(['restaurant', 'zone'])
+    restaurants = pd.concat(restaurants).groupby(level=0).sum()
+    restaurant_cells = np.union1d(restaurants.index.to_numpy(np.int64), pairs['restaurant'].to_numpy(np.int64))
+    zone_cells = np.unique(pairs['zone'].to_numpy(np.int64))
+
+    keys = (np.searchsorted(restaurant_cells, pairs['restaurant'].to_numpy(np.int64)) * len(zone_cells)
+            + np.searchsorted(zone_cells, pairs['zone'].to_numpy(np.int64)))
+    km = distance.distance_km(*(pairs[column].to_numpy() for column in COORDINATE_COLUMNS), method=method)
+    order = np.argsort(keys)
+
+    restaurants = restaurants.reindex(restaurant_cells, fill_value=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        prepare_time = (restaurants['sum'] / restaurants['count']).to_numpy('float64')
+    return GeoIndex(method, resolution, restaurant_cells, zone_cells, keys[order], km[order],
+                    restaurants['size'].to_numpy(np.int64), prepare_time)
+
+
+def evaluate(index, df, precision=main.DISTANCE_PRECISION):
+    # Hit rate and error of index lookups against exact distances, both raw and as the truncated model feature
+    coordinates = [df[column].astype('float64').to_numpy() for column in COORDINATE_COLUMNS]
+    hits = index.hits
+    cached = index.distance_km(*coordinates)
+    hit_rate = (index.hits - hits) / len(df) if len(df) else None
+    exact = distance.distance_km(*coordinates, method=index.method)
+    result = {'rows': len(df), 'hit_rate': hit_rate, 'max_error_km': float(np.nanmax(np.abs(cached - exact))),
+              'error_bound_km': index.error_bound_km()}
+    if precision is not None:
+        scale = 10 ** precision
+        result['feature_mismatch_rate'] = float(np.mean(np.floor(cached * scale) != np.floor(exact * scale)))
+    return result
+
+
+if __name__ == "__main__":
+    import artifact
+    import data
+
+    parser = argparse.ArgumentParser(description="Build the restaurant/zone distance index of a trained model")
+    parser.add_argument('input', nargs='?', default=str(data.TRAIN_CSV), help="CSV file with the columns of train.csv")
+    parser.add_argument('--model', default=str(artifact.default_model_path()),
+                        help="Model bundle directory or legacy model.pickle to store the index with")
+    parser.add_argument('--resolution', type=float, default=RESOLUTION, help="Grid cell size in degrees")
+    parser.add_argument('--chunksize', type=int, default=100000)
+    args = parser.parse_args()
+
+    model = artifact.load_artifact(args.model)
+    columns = COORDINATE_COLUMNS + ['Time_Orderd', 'Time_Order_picked']
+    index = build_geo_index(data.read_train_csv(args.input, usecols=columns, chunksize=args.chunksize),
+                            model.pipeline.distance_method, args.resolution)
+    artifact.save_geo_index(index, args.model)
+    print(f"Indexed {len(index.restaurant_cells):,} restaurants, {len(index.zone_cells):,} zones and "
+          f"{len(index.pair_keys):,} restaurant/zone pairs (error bound {index.error_bound_km():.2g} km)")
+    print(f"Lookups on the indexed orders: {evaluate(index, data.read_train_csv(args.input, usecols=columns))}")
@@ -1,177 +1,194 @@
-from pathlib import Path
 import numpy as np
 import pandas as pd
-from geopy.distance import geodesic
-import pickle
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder, StandardScaler
-import xgboost as xgb
-from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
 
+import distance
+from features import date_features, time_to_seconds
+import metrics
 
+# Distance settings are shared by training and inference so both produce identical features.
+# DISTANCE_PRECISION is the number of decimals kept (truncated); None keeps the full float.
+DISTANCE_METHOD = 'geodesic'
+DISTANCE_PRECISION = 0
+
+
+def _with_columns(df, columns):
+    # Shallow copy with columns added or replaced: the caller's frame is left untouched and the columns
+    # that are not replaced are shared with it rather than copied
+    out = df.copy(deep=False)
+    for column, values in columns.items():
+        out[column] = values
+    return out
+
+
+@metrics.timed('main.update_column_name')
 def update_column_name(df):
-    df.rename(columns={'Weatherconditions': 'Weather_conditions'}, inplace=True)
+    return df.rename(columns={'Weatherconditions': 'Weather_conditions'}, copy=False)
 
 
+@metrics.timed('main.extract_feature_value')
 def extract_feature_value(df):
     # Extract Weather conditions
-    df['Weather_conditions'] = df['Weather_conditions'].apply(lambda x: x.split(' ')[1].strip())
+    columns = {'Weather_conditions': df['Weather_conditions'].astype(str).str.split(' ').str[1]}
     # Extract city code from Delivery person ID
-    df['City_code'] = df['Delivery_person_ID'].str.split("RES", expand=True)[0]
+    columns['City_code'] = df['Delivery_person_ID'].str.split("RES").str[0]
 
-    #Remove Whitespaces on categorical value
-    categorical_columns = df.select_dtypes(include='object').columns
-    for column in categorical_columns:
-        df[column] = df[column].str.strip()
+    #Remove Whitespaces on categorical value (the ID columns are dropped next, so they are left as they are)
+    categorical_columns = df.select_dtypes(include=['object', 'category']).columns.drop(['ID', 'Delivery_person_ID'],
+                                                                                       errors='ignore')
+    for column in categorical_columns.union(['Weather_conditions', 'City_code'], sort=False):
+        columns[column] = columns.get(column, df.get(column)).astype(object).str.strip()
+    return _with_columns(df, columns)
 
 
+@metrics.timed('main.extract_label_value')
 def extract_label_value(df):
     # Extract time and convert to int
-    df['Time_taken(min)'] = df['Time_taken(min)'].apply(lambda x: int(x.split(' ')[1].strip()))
+    return _with_columns(df, {'Time_taken(min)': df['Time_taken(min)'].astype(str).str.split(' ').str[1]
+                             .str.strip().astype(int)})
 
 
+@metrics.timed('main.drop_columns')
 def drop_columns(df):
-    df.drop(['ID', 'Delivery_person_ID'], axis=1, inplace=True)
+    return df.drop(columns=['ID', 'Delivery_person_ID'])
 
 
+@metrics.timed('main.update_datatype')
 def update_datatype(df):
-    df['Delivery_person_Age'] = df['Delivery_person_Age'].astype('float64')
-    df['Delivery_person_Ratings'] = df['Delivery_person_Ratings'].astype('float64')
-    df['multiple_deliveries'] = df['multiple_deliveries'].astype('float64')
-    df['Order_Date'] = pd.to_datetime(df['Order_Date'], format="%d-%m-%Y")
+    return _with_columns(df, {
+        'Delivery_person_Age': df['Delivery_person_Age'].astype('float64'),
+        'Delivery_person_Ratings': df['Delivery_person_Ratings'].astype('float64'),
+        'multiple_deliveries': df['multiple_deliveries'].astype('float64'),
+        'Order_Date': pd.to_datetime(df['Order_Date'], format="%d-%m-%Y"),
+    })
 
 
+@metrics.timed('main.convert_nan')
 def convert_nan(df):
-    df.replace('NaN', float(np.nan), regex=True, inplace=True)
+    # Null markers are turned into NaN at parse time (data.NA_VALUES); only the ones embedded in a longer
+    # value, such as 'conditions NaN', are left as text after extract_feature_value and are masked here
+    columns = {}
+    for column in df.select_dtypes(include='object').columns:
+        values = df[column]
+        is_marker = values.str.contains('NaN', regex=False, na=False)
+        if is_marker.any():
+            columns[column] = values.mask(is_marker)
+    return _with_columns(df, columns) if columns else df
+
 
+NULL_MODE_COLUMNS = ['Weather_conditions', 'City', 'Festival', 'multiple_deliveries', 'Road_traffic_density']
+NULL_MEDIAN_COLUMNS = ['Delivery_person_Age', 'Delivery_person_Ratings']
 
-def handle_null_values(df):
-    df['Delivery_person_Age'].fillna(np.random.choice(df['Delivery_person_Age']), inplace=True)
-    df['Weather_conditions'].fillna(np.random.choice(df['Weather_conditions']), inplace=True)
-    df['City'].fillna(df['City'].mode()[0], inplace=True)
-    df['Festival'].fillna(df['Festival'].mode()[0], inplace=True)
-    df['multiple_deliveries'].fillna(df['multiple_deliveries'].mode()[0], inplace=True)
-    df['Road_traffic_density'].fillna(df['Road_traffic_density'].mode()[0], inplace=True)
-    df['Delivery_person_Ratings'].fillna(df['Delivery_person_Ratings'].median(), inplace=True)
 
+def fit_null_values(df):
+    # Learn the fill values once on training data so inference never depends on the batch it is given
+    null_values = {column: df[column].mode()[0] for column in NULL_MODE_COLUMNS}
+    null_values.update({column: df[column].median() for column in NULL_MEDIAN_COLUMNS})
+    return null_values
 
+
+@metrics.timed('main.handle_null_values')
+def handle_null_values(df, null_values):
+    return df.fillna({column: value for column, value in null_values.items() if column in df})
+
+
+@metrics.timed('main.extract_date_features')
 def extract_date_features(data):
-    data["day"] = data.Order_Date.dt.day
-    data["month"] = data.Order_Date.dt.month
-    data["quarter"] = data.Order_Date.dt.quarter
-    data["year"] = data.Order_Date.dt.year
-    data['day_of_week'] = data.Order_Date.dt.day_of_week.astype(int)
-    data["is_month_start"] = data.Order_Date.dt.is_month_start.astype(int)
-    data["is_month_end"] = data.Order_Date.dt.is_month_end.astype(int)
-    data["is_quarter_start"] = data.Order_Date.dt.is_quarter_start.astype(int)
-    data["is_quarter_end"] = data.Order_Date.dt.is_quarter_end.astype(int)
-    data["is_year_start"] = data.Order_Date.dt.is_year_start.astype(int)
-    data["is_year_end"] = data.Order_Date.dt.is_year_end.astype(int)
-    data['is_weekend'] = np.where(data['day_of_week'].isin([5, 6]), 1, 0)
-
-
-def calculate_time_diff(df):
-    # Find the difference between ordered time & picked time
-    df['Time_Orderd'] = pd.to_timedelta(df['Time_Orderd'])
-    df['Time_Order_picked'] = pd.to_timedelta(df['Time_Order_picked'])
+    return _with_columns(data, date_features(data['Order_Date']))
 
-    df['Time_Order_picked_formatted'] = df['Order_Date'] + np.where(df['Time_Order_picked'] < df['Time_Orderd'],
-                                                                    pd.DateOffset(days=1), pd.DateOffset(days=0)) + df[
-                                            'Time_Order_picked']
-    df['Time_Ordered_formatted'] = df['Order_Date'] + df['Time_Orderd']
 
-    df['order_prepare_time'] = (df['Time_Order_picked_formatted'] - df[
-        'Time_Ordered_formatted']).dt.total_seconds() / 60
+def order_prepare_minutes(time_ordered, time_picked):
+    # Pickups earlier in the day than the order happened after midnight, which the modulo rolls over
+    return np.mod(time_to_seconds(time_picked) - time_to_seconds(time_ordered), 86400) / 60
+
+
+@metrics.timed('main.calculate_time_diff')
+def calculate_time_diff(df, fill_value=None):
+    # Find the difference between ordered time & picked time
+    prepare_time = order_prepare_minutes(df['Time_Orderd'], df['Time_Order_picked'])
 
     # Handle null values by filling with the median
-    df['order_prepare_time'].fillna(df['order_prepare_time'].median(), inplace=True)
+    if fill_value is None:
+        fill_value = np.nanmedian(prepare_time)
+    prepare_time[np.isnan(prepare_time)] = fill_value
 
     # Drop all the time & date related columns
-    df.drop(['Time_Orderd', 'Time_Order_picked', 'Time_Ordered_formatted', 'Time_Order_picked_formatted', 'Order_Date'],
-            axis=1, inplace=True)
+    df = _with_columns(df.drop(columns=['Time_Orderd', 'Time_Order_picked', 'Order_Date']),
+                       {'order_prepare_time': prepare_time})
+    return df, fill_value
 
 
-def calculate_distance(df):
-    df['distance'] = np.zeros(len(df))
-    restaurant_coordinates = df[['Restaurant_latitude', 'Restaurant_longitude']].to_numpy()
-    delivery_location_coordinates = df[['Delivery_location_latitude', 'Delivery_location_longitude']].to_numpy()
-    df['distance'] = np.array([geodesic(restaurant, delivery) for restaurant, delivery in
-                               zip(restaurant_coordinates, delivery_location_coordinates)])
-    df['distance'] = df['distance'].astype("str").str.extract('(\d+)').astype("int64")
+@metrics.timed('main.calculate_distance')
+def calculate_distance(df, method=DISTANCE_METHOD, precision=DISTANCE_PRECISION):
+    km = distance.distance_km(df['Restaurant_latitude'].to_numpy(), df['Restaurant_longitude'].to_numpy(),
+                              df['Delivery_location_latitude'].to_numpy(), df['Delivery_location_longitude'].to_numpy(),
+                              method=method)
+    if precision is not None:
+        km = np.floor(km * 10 ** precision) / 10 ** precision
+    return _with_columns(df, {'distance': km})
 
 
+@metrics.timed('main.label_encoding')
 def label_encoding(df):
+    # Only fitting needs scikit-learn, so it is not imported with the module
+    from sklearn.preprocessing import LabelEncoder
+
     categorical_columns = df.select_dtypes(include='object').columns
     label_encoders = {}
 
     # Iterate over each categorical column and fit a label encoder
+    encoded = {}
     for column in categorical_columns:
-        df[column] = df[column].str.strip()  # Remove whitespaces
         label_encoder = LabelEncoder()
-        label_encoder.fit(df[column])
-        df[column] = label_encoder.transform(df[column])
+        encoded[column] = label_encoder.fit_transform(df[column])
         label_encoders[column] = label_encoder
-    return label_encoders
-
-
-def data_split(X, y):
-    # Split the data into train and test sets
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-    return X_train, X_test, y_train, y_test
-
-
-def standardize(X_train, X_test):
-    scaler = StandardScaler()
-
-    # Fit the scaler on the training data
-    scaler.fit(X_train)
+    return _with_columns(df, encoded), label_encoders
 
-    # Perform standardization
-    X_train = scaler.transform(X_train)
-    X_test = scaler.transform(X_test)
-    return X_train, X_test, scaler
 
+@metrics.timed('main.cleaning_steps')
+def cleaning_steps(df, null_values=None):
+    df = update_column_name(df)
+    df = extract_feature_value(df)
+    df = drop_columns(df)
+    df = update_datatype(df)
+    df = convert_nan(df)
+    if null_values is None:
+        null_values = fit_null_values(df)
+    return handle_null_values(df, null_values), null_values
 
-def cleaning_steps(df):
-    update_column_name(df)
-    extract_feature_value(df)
-    drop_columns(df)
-    update_datatype(df)
-    convert_nan(df)
-    handle_null_values(df)
 
-def perform_feature_engineering(df):
-    extract_date_features(df)
-    calculate_time_diff(df)
-    calculate_distance(df)
+@metrics.timed('main.perform_feature_engineering')
+def perform_feature_engineering(df, null_values=None):
+    df = extract_date_features(df)
+    df, prepare_time = calculate_time_diff(df, None if null_values is None else null_values.get('order_prepare_time'))
+    return calculate_distance(df), prepare_time
 
 
-def evaluate_model(y_test, y_pred):
-    mae = mean_absolute_error(y_test, y_pred)
-    mse = mean_squared_error(y_test, y_pred)
-    rmse = np.sqrt(mse)
-    r2 = r2_score(y_test, y_pred)
-
-    print("Mean Absolute Error (MAE):", round(mae, 2))
-    print("Mean Squared Error (MSE):", round(mse, 2))
-    print("Root Mean Squared Error (RMSE):", round(rmse, 2))
-    print("R-squared (R2) Score:", round(r2, 2))
+if __name__ == "__main__":
+    import xgboost as xgb
 
+    import artifact
+    import data
+    import geo_index
+    import training
+    from pipeline import FeaturePipeline
 
-if __name__ == "__main__":
-    df_train = pd.read_csv(str(Path(__file__).parents[1] / 'data/train.csv'))  # Load Data
-    cleaning_steps(df_train)  # Perform Cleaning
-    extract_label_value(df_train) #Extract Label Value
-    perform_feature_engineering(df_train)  # Perform feature engineering
+    df_train = data.read_train_csv()  # Load Data
+    df_train = extract_label_value(df_train)  # Extract Label Value
 
     # Split features & label
     X = df_train.drop('Time_taken(min)', axis=1)  # Features
     y = df_train['Time_taken(min)']  # Target variable
+    X_train, X_test, y_train, y_test = training.data_split(X, y)  # Test Train Split
 
-    label_encoders = label_encoding(X)  # Label Encoding
-    X_train, X_test, y_train, y_test = data_split(X, y)  # Test Train Split
-    X_train, X_test, scaler = standardize(X_train, X_test)  # Standardization
+    # Cleaning, feature engineering, label encoding & standardization
+    pipeline = FeaturePipeline().fit(X_train)
+
+    # Precompute restaurant/zone distances from the training orders and check them against the test orders
+    index = geo_index.build_geo_index([X_train], pipeline.distance_method)
+    print(f"Geo index on test orders: {geo_index.evaluate(index, X_test)}")
+
+    X_train = pipeline.transform(X_train)
+    X_test = pipeline.transform(X_test)
 
     # Build Model
     model = xgb.XGBRegressor(n_estimators=20, max_depth=9)
@@ -179,8 +196,10 @@ if __name__ == "__main__":
 
     # Evaluate Model
     y_pred = model.predict(X_test)
-    evaluate_model(y_test, y_pred)
+    training.evaluate_model(y_test, y_pred)
 
     # Save Model
-    with open(str(Path(__file__).parents[1] / 'code/model.pickle'), 'wb') as f:
-        pickle.dump((model, label_encoders, scaler), f)
+    artifact.save_artifact(model, pipeline, geo_index=index)
+
+    # Save the widget domains used by the Streamlit app, so it never needs the training data
+    data.save_ui_metadata(data.build_ui_metadata(data.clean_train(X)))
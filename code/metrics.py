@@ -0,0 +1,214 @@
+from contextlib import contextmanager
+import functools
+import math
+import os
+import threading
+import time
+
+# Latency buckets in seconds, Prometheus style (each bucket counts observations <= its bound)
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf)
+
+_enabled = os.environ.get('DELIVERY_METRICS', '') not in ('', '0')
+_histograms = {}
+_lock = threading.Lock()
+# Per-thread cProfile profiles of a running profiled(..., threads=True) session, None when there is none
+_thread_profiles = None
+_profile_local = threading.local()
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.rows = 0
+
+    def observe(self, seconds, rows):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.rows += rows or 0
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def observe(name, seconds, rows=None):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds, rows)
+
+
+class _Stage:
+    __slots__ = ('name', 'rows', 'start')
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, self.rows)
+        return False
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name, rows=None):
+    # Times a block: `with metrics.stage('distance', len(df)):`. A shared no-op when metrics are disabled.
+    return _Stage(name, rows) if _enabled else _NO_STAGE
+
+
+def timed(name):
+    # Decorator form of stage(); the row count is the length of the first argument that has one, skipping the self
+    # of methods (which may have a length of its own)
+    def decorator(fn):
+        skip = 1 if fn.__code__.co_varnames[:1] == ('self',) else 0
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                rows = next((len(arg) for arg in args[skip:] if hasattr(arg, '__len__')), None)
+                observe(name, time.perf_counter() - start, rows)
+        return wrapper
+    return decorator
+
+
+def _quantile(histogram, q):
+    # Upper bound of the bucket holding the q-th observation
+    target = q * histogram.count
+    cumulative = 0
+    for bound, count in zip(BUCKETS, histogram.buckets):
+        cumulative += count
+        if cumulative >= target:
+            return bound
+    return math.inf
+
+
+def snapshot():
+    with _lock:
+        return {
+            name: {
+                'count': h.count,
+                'rows': h.rows,
+                'total_seconds': h.sum,
+                'mean_ms': h.sum / h.count * 1000 if h.count else 0.0,
+                'p50_le_ms': _quantile(h, 0.5) * 1000,
+                'p99_le_ms': _quantile(h, 0.99) * 1000,
+            }
+            for name, h in _histograms.items()
+        }
+
+
+def prometheus_text():
+    lines = ['# HELP delivery_stage_seconds Wall time of prediction pipeline stages',
+             '# TYPE delivery_stage_seconds histogram']
+    rows = ['# HELP delivery_stage_rows_total Rows processed by prediction pipeline stages',
+            '# TYPE delivery_stage_rows_total counter']
+    with _lock:
+        for name, h in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, h.buckets):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append(f'delivery_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'delivery_stage_seconds_sum{{stage="{name}"}} {h.sum}')
+            lines.append(f'delivery_stage_seconds_count{{stage="{name}"}} {h.count}')
+            rows.append(f'delivery_stage_rows_total{{stage="{name}"}} {h.rows}')
+    return '\n'.join(lines + rows) + '\n'
+
+
+class _ProfileSection:
+    def __enter__(self):
+        # One profile per thread and session, enabled only inside sections
+        profiles = _thread_profiles
+        if getattr(_profile_local, 'profiles', None) is not profiles:
+            import cProfile
+            _profile_local.profiles = profiles
+            _profile_local.profiler = cProfile.Profile()
+            with _lock:
+                profiles.append(_profile_local.profiler)
+        self.profiler = _profile_local.profiler
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.disable()
+        return False
+
+
+def profile_section():
+    # Profiles a block run on a worker thread (a request or scoring thread) into the running
+    # profiled(..., threads=True) session. A shared no-op when there is none.
+    return _ProfileSection() if _thread_profiles is not None else _NO_STAGE
+
+
+@contextmanager
+def profiled(path, threads=False):
+    # Profile the enclosed block into path: an HTML report with pyinstrument for *.html, cProfile stats otherwise.
+    # cProfile only follows the thread that enables it, so with threads=True the profile_section() blocks of
+    # other threads are profiled as well and merged into the same stats.
+    global _thread_profiles
+    if str(path).endswith('.html'):
+        if threads:
+            raise ValueError("Profiles across threads are written as cProfile stats; use a .prof path")
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path, 'w') as f:
+                f.write(profiler.output_html())
+    else:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        if threads:
+            _thread_profiles = []
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            stats = pstats.Stats(profiler)
+            if threads:
+                with _lock:
+                    profiles, _thread_profiles = _thread_profiles, None
+                for thread_profiler in profiles:
+                    stats.add(thread_profiler)
+            stats.dump_stats(path)
@@ -0,0 +1,318 @@
+from collections import Counter
+import threading
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.preprocessing import StandardScaler
+from sklearn.utils.validation import check_is_fitted
+
+import distance
+import features
+from features import CATEGORICAL_COLUMNS, NUMERIC_COLUMNS
+import main
+import metrics
+
+# Raw columns transform() reads, besides the weather column (either 'Weatherconditions' or 'Weather_conditions')
+INPUT_COLUMNS = NUMERIC_COLUMNS + ['Delivery_person_ID', 'Order_Date', 'Time_Orderd', 'Time_Order_picked'] + [
+    column for column in CATEGORICAL_COLUMNS if column not in ('Weather_conditions', 'City_code')]
+
+# Raw columns each engineered feature is computed from, where that is not the column of the same name
+FEATURE_INPUTS = {
+    'Weather_conditions': ['Weatherconditions', 'Weather_conditions'],
+    'City_code': ['Delivery_person_ID'],
+    'order_prepare_time': ['Time_Orderd', 'Time_Order_picked'],
+    'distance': ['Restaurant_latitude', 'Restaurant_longitude', 'Delivery_location_latitude',
+                 'Delivery_location_longitude'],
+    **{name: ['Order_Date'] for name in features.date_features(np.empty(0, dtype='datetime64[D]'))},
+}
+
+_unknown_counts_lock = threading.Lock()
+
+
+class FeaturePipeline(BaseEstimator, TransformerMixin):
+    # Fuses main.cleaning_steps, main.perform_feature_engineering, label encoding and scaling into a single
+    # transform from raw orders (the columns of data/train.csv) to the model's float32 feature matrix.
+    # fit() runs the reference implementation in main.py once to learn the feature order, null fill values,
+    # encoders and scaler; transform() computes each feature column once and writes it straight into the
+    # output matrix.
+    # Categories not seen during fit are encoded as unknown_value, or raise a ValueError when it is 'raise'.
+    def __init__(self, distance_method=main.DISTANCE_METHOD, distance_precision=main.DISTANCE_PRECISION,
+                 unknown_value=-1):
+        self.distance_method = distance_method
+        self.distance_precision = distance_precision
+        self.unknown_value = unknown_value
+
+    def fit(self, X, y=None):
+        df, self.null_values_ = main.cleaning_steps(X)
+        df, self.null_values_['order_prepare_time'] = main.perform_feature_engineering(df)
+        df = df.drop(columns=['Time_taken(min)'], errors='ignore')
+
+        df, label_encoders = main.label_encoding(df)
+        scaler = StandardScaler().fit(df)
+        self._set_fitted(df.columns, {column: encoder.classes_ for column, encoder in label_encoders.items()},
+                         scaler.mean_, scaler.scale_, scaler.var_, scaler.n_samples_seen_)
+        return self
+
+    def partial_fit(self, X, y=None):
+        # Update a fitted pipeline with new orders. Unseen categories are appended to the vocabularies, so the
+        # existing codes keep their meaning, and the scaler statistics are merged with the new rows' running mean
+        # and variance. Null fill values are kept as they are.
+        check_is_fitted(self, 'mean_')
+        if self.n_samples_seen_ is None:
+            raise ValueError("The pipeline does not record how many rows its scaler was fitted on")
+        columns = self._feature_columns(X)
+        categories = {}
+        for column, classes in self.categories_.items():
+            values = pd.unique(pd.Series(columns[column]).dropna())
+            categories[column] = np.concatenate([classes, sorted(set(values) - set(classes))])
+        geo_index = self.geo_index_
+        self._set_fitted(self.feature_names_in_, categories, self.mean_, self.scale_, self.var_,
+                         self.n_samples_seen_)
+        self.geo_index_ = geo_index
+
+        values = np.column_stack(list(self._feature_values(X))) if len(X) else np.empty((0, self.n_features_in_))
+        mean = values.mean(axis=0) if len(X) else np.zeros(self.n_features_in_)
+        n, self.mean_, m2 = merge_moments((self.n_samples_seen_, self.mean_, self.var_ * self.n_samples_seen_),
+                                          (len(X), mean, ((values - mean) ** 2).sum(axis=0)))
+        self.n_samples_seen_ = int(n)
+        self.var_ = m2 / n
+        self.scale_ = scale_from_var(self.var_)
+        return self
+
+    def _set_fitted(self, feature_names, categories, mean, scale, var=None, n_samples_seen=None):
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.n_features_in_ = len(self.feature_names_in_)
+        self.categories_ = {column: np.asarray(classes, dtype=object) for column, classes in categories.items()}
+        self.mean_ = np.asarray(mean, dtype='float64')
+        self.scale_ = np.asarray(scale, dtype='float64')
+        # Pipelines saved before the variance was recorded: exact except for constant columns, scaled by 1
+        self.var_ = np.square(self.scale_) if var is None else np.asarray(var, dtype='float64')
+        self.n_samples_seen_ = None if n_samples_seen is None else int(n_samples_seen)
+        self.unknown_counts_ = Counter()
+        self._lookups = None
+        self.geo_index_ = None
+
+    def set_geo_index(self, geo_index):
+        # Distances are looked up in a precomputed geo_index.GeoIndex instead of computed, where it has them
+        if geo_index is not None and geo_index.method != self.distance_method:
+            raise ValueError(f"Geo index holds {geo_index.method} distances but the pipeline uses "
+                             f"{self.distance_method}")
+        self.geo_index_ = geo_index
+        return self
+
+    @classmethod
+    def from_fitted(cls, label_encoders, scaler, **params):
+        # Build a pipeline from the (label_encoders, scaler) pair stored by older model.pickle files
+        pipeline = cls(**params)
+        pipeline._set_fitted(scaler.feature_names_in_,
+                             {column: encoder.classes_ for column, encoder in label_encoders.items()},
+                             scaler.mean_, scaler.scale_, scaler.var_, scaler.n_samples_seen_)
+
+        # These artifacts carry no null fill values, so approximate them from the training means the scaler
+        # saw: the mean itself for numeric columns, the nearest class for encoded and count columns
+        means = dict(zip(pipeline.feature_names_in_, scaler.mean_))
+        pipeline.null_values_ = {
+            'Delivery_person_Age': means['Delivery_person_Age'],
+            'Delivery_person_Ratings': means['Delivery_person_Ratings'],
+            'multiple_deliveries': float(round(means['multiple_deliveries'])),
+            'order_prepare_time': means['order_prepare_time'],
+        }
+        for column in ['Weather_conditions', 'City', 'Festival', 'Road_traffic_density']:
+            classes = pipeline.categories_[column]
+            pipeline.null_values_[column] = classes[min(int(round(means[column])), len(classes) - 1)]
+        return pipeline
+
+    def to_dict(self):
+        # Plain JSON-serializable state: categories are integer lookup tables (code = position in the list)
+        check_is_fitted(self, 'mean_')
+        return {
+            'params': self.get_params(),
+            'feature_names': [str(name) for name in self.feature_names_in_],
+            'categories': {column: [str(value) for value in classes] for column, classes in self.categories_.items()},
+            'mean': self.mean_.tolist(),
+            'scale': self.scale_.tolist(),
+            'var': self.var_.tolist(),
+            'n_samples_seen': self.n_samples_seen_,
+            'null_values': {column: value if isinstance(value, str) else float(value)
+                            for column, value in self.null_values_.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        pipeline = cls(**state['params'])
+        pipeline._set_fitted(state['feature_names'], state['categories'], state['mean'], state['scale'],
+                             state.get('var'), state.get('n_samples_seen'))
+        pipeline.null_values_ = dict(state['null_values'])
+        return pipeline
+
+    @metrics.timed('pipeline.transform')
+    def transform(self, X):
+        check_is_fitted(self, 'mean_')
+        out = np.empty((len(X), self.n_features_in_), dtype=np.float32)
+        for i, values in enumerate(self._feature_values(X)):
+            out[:, i] = (values - self.mean_[i]) / self.scale_[i]
+        return out
+
+    def transform_unscaled(self, X):
+        # Encoded float64 features before standardization, for callers that accumulate their own scaler statistics
+        check_is_fitted(self, 'mean_')
+        out = np.empty((len(X), self.n_features_in_), dtype='float64')
+        for i, values in enumerate(self._feature_values(X)):
+            out[:, i] = values
+        return out
+
+    def transform_grid(self, order, fields, how='product'):
+        # Features of the scenarios built from one base order (a dict or one-row DataFrame) and arrays of values
+        # for some of its raw columns, e.g. {'Type_of_vehicle': [...], 'Time_Order_picked': [...]}. With
+        # how='product' every combination is a row, the last field varying fastest; with how='zip' row i takes
+        # the i-th value of each field. Features that no field feeds (distance and the date flags, unless their
+        # columns vary) are computed once from the base order, the others once per distinct combination of the
+        # fields feeding them. The rows equal transform() of the fully expanded orders.
+        check_is_fitted(self, 'mean_')
+        base = order if isinstance(order, pd.DataFrame) else pd.DataFrame([order])
+        if len(base) != 1:
+            raise ValueError(f"Expected one base order, got {len(base)}")
+        values = {field: np.asarray(field_values, dtype=object) for field, field_values in fields.items()}
+        fed = {}
+        for field in values:
+            if field not in base:
+                raise ValueError(f"{field} is not a column of the base order")
+            fed[field] = {i for i, name in enumerate(self.feature_names_in_)
+                          if field in FEATURE_INPUTS.get(name, [name])}
+            if not fed[field]:
+                raise ValueError(f"{field} does not feed any feature")
+
+        if how == 'product':
+            n = int(np.prod([len(field_values) for field_values in values.values()]))
+            grid = np.indices([len(field_values) for field_values in values.values()]).reshape(len(values), n)
+            index = dict(zip(values, grid))
+        elif how == 'zip':
+            lengths = {len(field_values) for field_values in values.values()}
+            if len(lengths) > 1:
+                raise ValueError(f"Zipped fields must have the same length, got {sorted(lengths)}")
+            n = lengths.pop() if lengths else 1
+            index = {field: np.arange(n) for field in values}
+        else:
+            raise ValueError(f"how must be 'product' or 'zip', not {how!r}")
+
+        # Fields feeding a common feature (e.g. both order times) are expanded together
+        groups = []
+        for field in values:
+            members, columns = [field], set(fed[field])
+            for group in [group for group in groups if group[1] & columns]:
+                groups.remove(group)
+                members = group[0] + members
+                columns |= group[1]
+            groups.append((members, columns))
+
+        with metrics.stage('pipeline.transform_grid', n):
+            out = np.empty((n, self.n_features_in_), dtype=np.float32)
+            out[:] = (self.transform_unscaled(base)[0] - self.mean_) / self.scale_
+            if n == 0:
+                return out
+            for members, columns in groups:
+                combos, inverse = np.unique(np.column_stack([index[field] for field in members]), axis=0,
+                                            return_inverse=True)
+                frame = base.iloc[np.zeros(len(combos), dtype=int)].reset_index(drop=True)
+                for j, field in enumerate(members):
+                    frame[field] = values[field][combos[:, j]]
+                columns = sorted(columns)
+                out[:, columns] = ((self.transform_unscaled(frame)[:, columns] - self.mean_[columns])
+                                   / self.scale_[columns])[inverse.reshape(-1)]
+        return out
+
+    def _feature_values(self, X):
+        columns = self._feature_columns(X)
+        for name in self.feature_names_in_:
+            values = columns[name]
+            if name in self.categories_:
+                values = self._encode(name, values)
+            yield np.asarray(values, dtype='float64')
+
+    def _encode(self, column, values):
+        # Hash lookup of each value's position in the classes (the same codes sklearn's LabelEncoder assigns, with
+        # classes added by partial_fit after them)
+        if self._lookups is None:
+            self._lookups = {name: pd.Index(classes) for name, classes in self.categories_.items()}
+        codes = self._lookups[column].get_indexer(np.asarray(values, dtype=object))
+        unseen = codes == -1
+        if unseen.any():
+            if self.unknown_value == 'raise':
+                values = np.asarray(values, dtype=object)
+                raise ValueError(f"{column} contains previously unseen labels: {sorted(set(values[unseen]))}")
+            with _unknown_counts_lock:
+                self.unknown_counts_[column] += int(unseen.sum())
+            codes[unseen] = self.unknown_value
+        return codes
+
+    def get_feature_names_out(self, input_features=None):
+        check_is_fitted(self, 'feature_names_in_')
+        return self.feature_names_in_.copy()
+
+    def _feature_columns(self, X):
+        with metrics.stage('pipeline.clean', len(X)):
+            # Raw values read 'conditions Sunny'; those of the cleaned column name are the weather itself
+            if 'Weatherconditions' in X:
+                weather = X['Weatherconditions'].astype(object)
+                text = weather.astype(str)
+                malformed = (weather.notna() & ~text.str.strip().isin(['', 'NaN'])
+                             & ~text.str.startswith('conditions '))
+                if malformed.any():
+                    # Raises the same error as features.weather_condition
+                    features.weather_condition(weather[malformed].iloc[0])
+                weather = text.str.split(' ').str[1]
+            else:
+                weather = X['Weather_conditions']
+            clean = {
+                'Weather_conditions': weather,
+                'City_code': X['Delivery_person_ID'].str.split('RES').str[0],
+            }
+            for column in CATEGORICAL_COLUMNS:
+                values = clean[column] if column in clean else X[column]
+                values = values.astype(object).str.strip()
+                clean[column] = values.mask(values.str.contains('NaN', regex=False, na=False))
+            for column in NUMERIC_COLUMNS:
+                clean[column] = X[column].astype('float64')
+            clean = pd.DataFrame(clean, index=X.index)
+            clean = main.handle_null_values(clean, self.null_values_)
+
+        with metrics.stage('pipeline.datetime', len(X)):
+            order_date = pd.to_datetime(X['Order_Date'], format="%d-%m-%Y")
+            date_columns = features.date_features(order_date)
+            prepare_time = main.order_prepare_minutes(X['Time_Orderd'], X['Time_Order_picked'])
+            prepare_time[np.isnan(prepare_time)] = self.null_values_['order_prepare_time']
+
+        with metrics.stage('pipeline.distance', len(X)):
+            coordinates = (clean['Restaurant_latitude'], clean['Restaurant_longitude'],
+                           clean['Delivery_location_latitude'], clean['Delivery_location_longitude'])
+            geo_index = getattr(self, 'geo_index_', None)
+            if geo_index is not None:
+                km = geo_index.distance_km(*coordinates)
+            else:
+                km = distance.distance_km(*coordinates, method=self.distance_method)
+            if self.distance_precision is not None:
+                km = np.floor(km * 10 ** self.distance_precision) / 10 ** self.distance_precision
+
+        columns = {column: clean[column].to_numpy() for column in clean.columns}
+        columns.update(date_columns)
+        columns['order_prepare_time'] = prepare_time
+        columns['distance'] = km
+        return columns
+
+
+def merge_moments(a, b):
+    # Chan et al. parallel update of (count, mean, sum of squared deviations)
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    if n == 0:
+        return a
+    delta = mean_b - mean_a
+    return n, mean_a + delta * n_b / n, m2_a + m2_b + delta ** 2 * n_a * n_b / n
+
+
+def scale_from_var(var):
+    # Standard deviations, with 1 for constant columns as StandardScaler does
+    scale = np.sqrt(var)
+    return np.where(scale < 10 * np.finfo(np.float64).eps, 1.0, scale)
@@ -1,18 +1,155 @@
 from pathlib import Path
-import main
-import pickle
+import argparse
+import sys
+import threading
+import time
+
+import pandas as pd
+
+import artifact
+from cache import CACHE_SIZE, CACHE_TTL, CachedPredictor
+import data
+import metrics
+
+MODEL_PATH = artifact.default_model_path()
+
+
+class Predictor(CachedPredictor):
+    # Serves a model bundle (or legacy model.pickle), reloaded when its manifest changes on disk, with
+    # predictions memoized per engineered feature vector (see cache.CachedPredictor).
+    def __init__(self, path=MODEL_PATH, cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL):
+        super().__init__(Path(path), cache_size, cache_ttl)
+
+    def unknown_counts(self):
+        return dict(self._artifact[0].pipeline.unknown_counts_)
+
+    def geo_index_stats(self):
+        geo_index = getattr(self._artifact[0].pipeline, 'geo_index_', None)
+        return geo_index.stats() if geo_index is not None else None
+
+    def _manifest_path(self):
+        return artifact.manifest_path(self.path)
+
+    def _load(self):
+        return artifact.load_artifact(self.path)
+
+    def _transform(self, model, X):
+        return model.pipeline.transform(X)
+
+    def _score(self, model, features):
+        return model.predict(features)
+
+    def predict_grid(self, order, fields, how='product'):
+        # ETAs for the scenarios of FeaturePipeline.transform_grid from a single model call, bypassing the cache.
+        # Product grids come back shaped by the fields' lengths, in order.
+        with metrics.stage('predict.reload_check'):
+            self.reload()
+        model, _ = self._artifact
+        features = model.pipeline.transform_grid(order, fields, how)
+        with metrics.stage('predict.model', len(features)):
+            pred = model.predict(features)
+        return pred.reshape([len(field_values) for field_values in fields.values()]) if how == 'product' else pred
+
+
+_predictors = {}
+_predictors_lock = threading.Lock()
+
+
+def get_predictor(path=MODEL_PATH, cache_size=CACHE_SIZE):
+    key = Path(path), cache_size
+    if key not in _predictors:
+        with _predictors_lock:
+            if key not in _predictors:
+                _predictors[key] = Predictor(*key)
+    return _predictors[key]
 
 
 def predict(X):
-    # Load the model and scaler from the saved file
-    with open(str(Path(__file__).parents[1] / 'code/model.pickle'), 'rb') as f:
-        model, label_encoders, scaler = pickle.load(f)
-
-    main.cleaning_steps(X)  # Perform Cleaning
-    main.perform_feature_engineering(X)  # Perform Feature Engineering
-    # Label Encoding
-    for column, label_encoder in label_encoders.items():
-        X[column] = label_encoder.transform(X[column])
-    X = scaler.transform(X)  # Standardize
-    pred = model.predict(X)
-    return pred
+    return get_predictor().predict(X)
+
+
+def predict_grid(order, fields, how='product'):
+    return get_predictor().predict_grid(order, fields, how)
+
+
+def read_chunks(path, chunksize):
+    if Path(path).suffix == '.parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+class ChunkWriter:
+    # Appends prediction chunks to a CSV or Parquet file as they arrive
+    def __init__(self, path):
+        self.path = Path(path)
+        self._parquet_writer = None
+        self._first = True
+
+    def write(self, df):
+        if self.path.suffix == '.parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode='w' if self._first else 'a', header=self._first, index=False)
+        self._first = False
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def score_chunk(chunk, model_path=MODEL_PATH):
+    ids = chunk['ID'].astype(str).str.strip() if 'ID' in chunk else pd.Series(chunk.index)
+    # Backfill rows rarely repeat, so a prediction cache would only add lookups and evictions
+    pred = get_predictor(model_path, cache_size=0).predict(chunk)
+    return pd.DataFrame({'ID': ids.to_numpy(), 'Time_taken(min)': pred})
+
+
+def predict_file(input_path, output_path, chunksize=10000, workers=1, model_path=MODEL_PATH, progress=True):
+    writer = ChunkWriter(output_path)
+    start = time.perf_counter()
+    rows = 0
+    try:
+        chunks = ((chunk, model_path) for chunk in read_chunks(input_path, chunksize))
+        for result in data.bounded_map(score_chunk, chunks, workers):
+            writer.write(result)
+            rows += len(result)
+            if progress:
+                elapsed = time.perf_counter() - start
+                print(f"\r{rows} rows scored, {rows / elapsed:,.0f} rows/sec", end='', file=sys.stderr)
+    finally:
+        writer.close()
+        if progress:
+            print(file=sys.stderr)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a CSV or Parquet file of orders in chunks")
+    parser.add_argument('input', help="CSV or Parquet file with the columns of data/train.csv")
+    parser.add_argument('output', help="CSV or Parquet file to write ID and predicted Time_taken(min) to")
+    parser.add_argument('--chunksize', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=1, help="Number of processes scoring chunks in parallel")
+    parser.add_argument('--model', default=str(MODEL_PATH), help="Model bundle directory or legacy model.pickle")
+    parser.add_argument('--quiet', action='store_true', help="Do not print progress")
+    parser.add_argument('--metrics', action='store_true', help="Print per-stage latency when done (single process only)")
+    parser.add_argument('--profile', help="Write a cProfile dump (or pyinstrument .html report) of the run")
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable()
+    if args.profile:
+        with metrics.profiled(args.profile):
+            predict_file(args.input, args.output, args.chunksize, args.workers, args.model, not args.quiet)
+    else:
+        predict_file(args.input, args.output, args.chunksize, args.workers, args.model, not args.quiet)
+    if args.metrics:
+        for name, stats in sorted(metrics.snapshot().items()):
+            print(f"{name:<32}{stats['count']:>8} calls{stats['rows']:>12,} rows{stats['mean_ms']:>10.2f} ms mean",
+                  file=sys.stderr)
@@ -0,0 +1,157 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+
+import pandas as pd
+
+import metrics
+from pipeline import INPUT_COLUMNS
+import predict
+
+
+def health(predictor):
+    cache = predictor.cache.stats() if predictor.cache is not None else None
+    return {'status': 'ok', 'model': predictor.digest, 'cache': cache, 'unknown_categories': predictor.unknown_counts(),
+            'geo_index': predictor.geo_index_stats()}
+
+
+def parse_orders(body):
+    # Accept a single order object or a list of orders, with the columns of data/train.csv. Every order is
+    # checked on its own, since orders scored together in one frame would otherwise fill each other's gaps.
+    payload = json.loads(body)
+    orders = payload if isinstance(payload, list) else [payload]
+    for order in orders:
+        _check_order(order)
+        _rename_weather(order)
+    return orders
+
+
+def parse_grid(body):
+    # {"order": {...}, "fields": {"<column>": [values, ...], ...}, "how": "product" or "zip"}
+    payload = json.loads(body)
+    if not isinstance(payload, dict) or not isinstance(payload.get('fields'), dict):
+        raise TypeError("Expected a JSON object with an order and a fields object")
+    _check_order(payload.get('order'))
+    if not all(isinstance(values, list) for values in payload['fields'].values()):
+        raise TypeError("Every field must map to a list of values")
+    _rename_weather(payload['order'])
+    if 'Weather_conditions' in payload['fields']:
+        values = payload['fields'].pop('Weather_conditions')
+        payload['fields'].setdefault('Weatherconditions', [_raw_weather(value) for value in values])
+    return payload['order'], payload['fields'], payload.get('how', 'product')
+
+
+def _check_order(order):
+    if not isinstance(order, dict):
+        raise TypeError("Orders must be JSON objects")
+    missing = [column for column in INPUT_COLUMNS if column not in order]
+    if 'Weatherconditions' not in order and 'Weather_conditions' not in order:
+        missing.append('Weatherconditions')
+    if missing:
+        raise ValueError(f"Order is missing {', '.join(missing)}")
+
+
+def _raw_weather(value):
+    return None if value is None else f'conditions {value}'
+
+
+def _rename_weather(order):
+    # Orders may give the raw column ('Weatherconditions': 'conditions Sunny') or the cleaned one
+    # ('Weather_conditions': 'Sunny'). Frames built from several orders (a list, or requests batched together)
+    # would leave NaN in the column an order does not use, so every order is given the raw column.
+    if 'Weather_conditions' in order:
+        order.setdefault('Weatherconditions', _raw_weather(order.pop('Weather_conditions')))
+
+
+def make_handler(predictor):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        # Every response carries a Content-Length, so clients can keep their connection open between requests
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_text(self, status, text):
+            body = text.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, health(predictor))
+            elif self.path == '/metrics':
+                self._send_text(200, metrics.prometheus_text())
+            elif self.path == '/stats':
+                self._send_json(200, {'enabled': metrics.is_enabled(), 'stages': metrics.snapshot()})
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            with metrics.profile_section():
+                self._post()
+
+        def _post(self):
+            # The body is read whatever the path: left unread, it would be parsed as the connection's next request
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.path not in ('/predict', '/predict_grid'):
+                self._send_json(404, {'error': 'not found'})
+                return
+            try:
+                if self.path == '/predict_grid':
+                    predictions = predictor.predict_grid(*parse_grid(body)).tolist()
+                else:
+                    # An empty list has no columns for the pipeline to read, and nothing to score
+                    orders = parse_orders(body)
+                    pred = predictor.predict(pd.DataFrame.from_records(orders)) if orders else []
+                    predictions = [float(p) for p in pred]
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {'error': str(e)})
+                return
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+            self._send_json(200, {'predictions': predictions})
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+def serve(host='127.0.0.1', port=8000, model_path=predict.MODEL_PATH):
+    predictor = predict.Predictor(model_path)
+    server = ThreadingHTTPServer((host, port), make_handler(predictor))
+    print(f"Serving predictions on http://{host}:{port}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP/JSON scoring endpoint for the delivery time model")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--model', default=str(predict.MODEL_PATH), help="Model bundle directory or legacy model.pickle")
+    parser.add_argument('--metrics', action='store_true', help="Record per-stage latency for /metrics and /stats")
+    parser.add_argument('--profile', help="Profile request handling until shutdown into this cProfile stats file")
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable()
+    if args.profile:
+        # Requests are handled on their own threads
+        with metrics.profiled(args.profile, threads=True):
+            serve(args.host, args.port, args.model)
+    else:
+        serve(args.host, args.port, args.model)
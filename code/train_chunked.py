@@ -0,0 +1,186 @@
+from collections import Counter
+from pathlib import Path
+import argparse
+import os
+import resource
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+import artifact
+import data
+import geo_index
+import main
+from pipeline import CATEGORICAL_COLUMNS, FeaturePipeline, merge_moments, scale_from_var
+import training
+
+LABEL = 'Time_taken(min)'
+FEATURE_CACHE_DIR = data.SNAPSHOT_DIR / 'features'
+XGB_PARAMS = {'objective': 'reg:squarederror', 'tree_method': 'hist', 'max_depth': 9}
+NUM_BOOST_ROUND = 20
+
+
+def _test_mask(chunk_index, n, test_size, seed):
+    # Deterministic per chunk, so every pass assigns each row to the same side of the split
+    return np.random.default_rng([seed, chunk_index]).random(n) < test_size
+
+
+def chunk_statistics(chunk_index, chunk, test_size, seed):
+    # Value counts of the training rows, from which exact modes, medians, category sets and the app's widget
+    # domains are merged later
+    df = chunk[~_test_mask(chunk_index, len(chunk), test_size, seed)]
+    df = main.update_column_name(df)
+    df = main.extract_feature_value(df)
+    df = main.drop_columns(df)
+    df = main.update_datatype(df)
+    df = main.convert_nan(df)
+
+    # Vehicle_condition is only counted for the app's widget domains
+    counts = {column: Counter(df[column].dropna().tolist())
+              for column in main.NULL_MODE_COLUMNS + main.NULL_MEDIAN_COLUMNS + CATEGORICAL_COLUMNS
+              + ['Vehicle_condition']}
+    prepare_time = main.order_prepare_minutes(df['Time_Orderd'], df['Time_Order_picked'])
+    counts['order_prepare_time'] = Counter(prepare_time[~np.isnan(prepare_time)].tolist())
+    return counts
+
+
+def chunk_features(chunk_index, chunk, pipeline_state, test_size, seed, cache_dir):
+    # Engineer one chunk into the on-disk feature cache and return the moments of its training rows
+    pipeline = FeaturePipeline.from_dict(pipeline_state)
+    df = pd.DataFrame(pipeline.transform_unscaled(chunk), columns=pipeline.feature_names_in_)
+    df[LABEL] = chunk[LABEL].astype(str).str.split(' ').str[1].astype('float32').to_numpy()
+
+    test = _test_mask(chunk_index, len(chunk), test_size, seed)
+    df[~test].to_parquet(Path(cache_dir) / 'train' / f'part-{chunk_index:05d}.parquet', index=False)
+    df[test].to_parquet(Path(cache_dir) / 'test' / f'part-{chunk_index:05d}.parquet', index=False)
+
+    features = df.loc[~test, pipeline.feature_names_in_].to_numpy()
+    if len(features) == 0:
+        return 0, np.zeros(features.shape[1]), np.zeros(features.shape[1])
+    mean = features.mean(axis=0)
+    return len(features), mean, ((features - mean) ** 2).sum(axis=0)
+
+
+def _mode(counts):
+    # pandas' mode()[0]: the most frequent value, the smallest one on ties
+    top = max(counts.values())
+    return min(value for value, count in counts.items() if count == top)
+
+
+def _median(counts):
+    values = sorted(counts)
+    cumulative = np.cumsum([counts[value] for value in values])
+    total = cumulative[-1]
+    lower = values[np.searchsorted(cumulative, (total + 1) // 2)]
+    upper = values[np.searchsorted(cumulative, total // 2 + 1)]
+    return (lower + upper) / 2
+
+
+class ParquetIterator(xgb.DataIter):
+    # Streams cached feature files into XGBoost, standardizing each one the same way FeaturePipeline.transform does
+    def __init__(self, files, pipeline, cache_prefix):
+        self._files = files
+        self._pipeline = pipeline
+        self._index = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._index == len(self._files):
+            return False
+        df = pd.read_parquet(self._files[self._index])
+        features = df[self._pipeline.feature_names_in_].to_numpy()
+        input_data(data=((features - self._pipeline.mean_) / self._pipeline.scale_).astype(np.float32),
+                   label=df[LABEL].to_numpy())
+        self._index += 1
+        return True
+
+    def reset(self):
+        self._index = 0
+
+
+def train(path=data.TRAIN_CSV, chunksize=100000, workers=None, test_size=0.2, seed=42, cache_dir=FEATURE_CACHE_DIR,
+          output=artifact.MODEL_DIR):
+    workers = workers or os.cpu_count()
+    cache_dir = Path(cache_dir)
+    start = time.perf_counter()
+
+    # Pass 1: null fill values and category tables from value counts of every chunk
+    counts = {}
+    reader = data.read_train_csv(path, chunksize=chunksize)
+    for chunk_counts in data.bounded_map(chunk_statistics,
+                                         ((i, chunk, test_size, seed) for i, chunk in enumerate(reader)), workers):
+        for column, column_counts in chunk_counts.items():
+            counts.setdefault(column, Counter()).update(column_counts)
+
+    null_values = {column: _mode(counts[column]) for column in main.NULL_MODE_COLUMNS}
+    null_values.update({column: _median(counts[column]) for column in main.NULL_MEDIAN_COLUMNS})
+    null_values['order_prepare_time'] = _median(counts['order_prepare_time'])
+    categories = {column: sorted(counts[column]) for column in CATEGORICAL_COLUMNS}
+
+    # The feature order comes from the reference implementation, exactly as FeaturePipeline.fit gets it
+    sample = data.read_train_csv(path, nrows=100).drop(columns=[LABEL])
+    sample, _ = main.cleaning_steps(sample)
+    sample, _ = main.perform_feature_engineering(sample)
+    pipeline = FeaturePipeline()
+    pipeline._set_fitted(sample.columns, categories, np.zeros(sample.shape[1]), np.ones(sample.shape[1]))
+    pipeline.null_values_ = null_values
+
+    # Pass 2: engineer every chunk into the feature cache while accumulating the scaler statistics
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    (cache_dir / 'train').mkdir(parents=True)
+    (cache_dir / 'test').mkdir(parents=True)
+    moments = (0, np.zeros(pipeline.n_features_in_), np.zeros(pipeline.n_features_in_))
+    reader = data.read_train_csv(path, chunksize=chunksize)
+    state = pipeline.to_dict()
+    for chunk_moments in data.bounded_map(chunk_features, ((i, chunk, state, test_size, seed, cache_dir)
+                                                           for i, chunk in enumerate(reader)), workers):
+        moments = merge_moments(moments, chunk_moments)
+    n, mean, m2 = moments
+    pipeline._set_fitted(pipeline.feature_names_in_, categories, mean, scale_from_var(m2 / n), m2 / n, n)
+    engineered = time.perf_counter()
+
+    # Train from the cache with XGBoost's external memory support
+    train_iter = ParquetIterator(sorted((cache_dir / 'train').glob('*.parquet')), pipeline,
+                                 str(cache_dir / 'xgb-cache'))
+    dmatrix = getattr(xgb, 'ExtMemQuantileDMatrix', None)
+    dtrain = dmatrix(train_iter) if dmatrix is not None else xgb.DMatrix(train_iter)
+    booster = xgb.train({**XGB_PARAMS, 'nthread': workers}, dtrain, num_boost_round=NUM_BOOST_ROUND)
+    trained = time.perf_counter()
+
+    # Evaluate on the held out rows, one cached file at a time
+    y_test, y_pred = [], []
+    for file in sorted((cache_dir / 'test').glob('*.parquet')):
+        df = pd.read_parquet(file)
+        features = ((df[pipeline.feature_names_in_].to_numpy() - pipeline.mean_) / pipeline.scale_).astype(np.float32)
+        y_test.append(df[LABEL].to_numpy())
+        y_pred.append(booster.inplace_predict(features))
+    training.evaluate_model(np.concatenate(y_test), np.concatenate(y_pred))
+
+    columns = geo_index.COORDINATE_COLUMNS + ['Time_Orderd', 'Time_Order_picked']
+    index = geo_index.build_geo_index(chunk[~_test_mask(i, len(chunk), test_size, seed)] for i, chunk in enumerate(
+        data.read_train_csv(path, usecols=columns, chunksize=chunksize)))
+    artifact.save_artifact(booster, pipeline, output, geo_index=index)
+    # Widget domains for the Streamlit app, from the first pass's counts rather than the training data in memory
+    data.save_ui_metadata(data.ui_metadata_from_counts(counts))
+
+    print(f"Rows: {n:,} train")
+    print(f"Feature engineering: {engineered - start:.1f}s, training: {trained - engineered:.1f}s, "
+          f"total: {time.perf_counter() - start:.1f}s")
+    # ru_maxrss is reported in kilobytes on Linux
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB (main process), "
+          f"{resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024:.0f} MB (largest worker)")
+    return booster, pipeline
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Out-of-core training on order files larger than memory")
+    parser.add_argument('input', nargs='?', default=str(data.TRAIN_CSV), help="CSV file with the columns of train.csv")
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=None, help="Processes for feature engineering & training threads")
+    parser.add_argument('--cache-dir', default=str(FEATURE_CACHE_DIR), help="Directory of the engineered feature cache")
+    parser.add_argument('--output', default=str(artifact.MODEL_DIR), help="Model bundle directory to write")
+    args = parser.parse_args()
+    train(args.input, args.chunksize, args.workers, cache_dir=args.cache_dir, output=args.output)
@@ -0,0 +1,41 @@
+import numpy as np
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
+
+import metrics
+
+# Training-only helpers, kept out of main.py so the serving code that imports it never loads
+# scikit-learn's model selection and metrics modules
+
+
+def data_split(X, y):
+    # Split the data into train and test sets
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    return X_train, X_test, y_train, y_test
+
+
+@metrics.timed('training.standardize')
+def standardize(X_train, X_test):
+    scaler = StandardScaler()
+
+    # Fit the scaler on the training data
+    scaler.fit(X_train)
+
+    # Perform standardization
+    X_train = scaler.transform(X_train)
+    X_test = scaler.transform(X_test)
+    return X_train, X_test, scaler
+
+
+def evaluate_model(y_test, y_pred):
+    mae = mean_absolute_error(y_test, y_pred)
+    mse = mean_squared_error(y_test, y_pred)
+    rmse = np.sqrt(mse)
+    r2 = r2_score(y_test, y_pred)
+
+    print("Mean Absolute Error (MAE):", round(mae, 2))
+    print("Mean Squared Error (MSE):", round(mse, 2))
+    print("Root Mean Squared Error (RMSE):", round(rmse, 2))
+    print("R-squared (R2) Score:", round(r2, 2))
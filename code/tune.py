@@ -0,0 +1,213 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import xgboost as xgb
+
+import artifact
+import data
+import geo_index
+from geo_index import GeoIndex
+import main
+from pipeline import FeaturePipeline
+import training
+
+LABEL = 'Time_taken(min)'
+TUNE_CACHE_DIR = data.SNAPSHOT_DIR / 'tune'
+BASE_PARAMS = {'objective': 'reg:squarederror', 'tree_method': 'hist', 'eval_metric': 'mae'}
+# The model main.py trains, tried first so the results show where it stands
+BASELINE_PARAMS = {'max_depth': 9}
+SEARCH_SPACE = {
+    'max_depth': [3, 4, 5, 6, 7, 8, 9, 10],
+    'learning_rate': [0.03, 0.05, 0.1, 0.2, 0.3],
+    'min_child_weight': [1, 2, 4, 8, 16],
+    'subsample': [0.6, 0.8, 1.0],
+    'colsample_bytree': [0.6, 0.8, 1.0],
+    'reg_lambda': [0.1, 1, 10],
+}
+# Successive halving: every trial gets MIN_ROUNDS boosting rounds, then the best 1/ETA of them get ETA times more,
+# up to MAX_ROUNDS. A trial also stops once its validation MAE has not improved for EARLY_STOPPING_ROUNDS rounds.
+MIN_ROUNDS = 20
+MAX_ROUNDS = 540
+ETA = 3
+EARLY_STOPPING_ROUNDS = 10
+
+
+def engineered_features(path=data.TRAIN_CSV, cache_dir=TUNE_CACHE_DIR):
+    # Feature engineering runs once per training file: the train/validation split of training.data_split is saved
+    # as XGBoost binary DMatrix files, next to the fitted pipeline and geo index, keyed by the CSV's content hash.
+    # Trials never repeat it, whatever their parameters.
+    directory = Path(cache_dir) / f'{Path(path).stem}-{data.file_digest(path)[:16]}'
+    if (directory / 'valid.buffer').exists():
+        return directory
+
+    df = main.extract_label_value(data.read_train_csv(path))
+    X_train, X_valid, y_train, y_valid = training.data_split(df.drop(columns=[LABEL]), df[LABEL])
+    pipeline = FeaturePipeline().fit(X_train)
+    index = geo_index.build_geo_index([X_train], pipeline.distance_method)
+
+    tmp = directory.with_name(directory.name + '.tmp')
+    tmp.mkdir(parents=True, exist_ok=True)
+    xgb.DMatrix(pipeline.transform(X_train), label=y_train).save_binary(str(tmp / 'train.buffer'))
+    X_valid = pipeline.transform(X_valid)
+    xgb.DMatrix(X_valid, label=y_valid).save_binary(str(tmp / 'valid.buffer'))
+    # Plain rows for timing single-order scoring
+    np.save(tmp / 'valid.npy', X_valid)
+    (tmp / 'pipeline.json').write_text(json.dumps(pipeline.to_dict()))
+    (tmp / 'geo.npz').write_bytes(index.to_bytes())
+    os.replace(tmp, directory)
+    return directory
+
+
+def sample_configs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    configs = [dict(BASELINE_PARAMS)]
+    while len(configs) < n:
+        config = {name: values[rng.integers(len(values))] for name, values in SEARCH_SPACE.items()}
+        configs.append({name: value.item() if hasattr(value, 'item') else value for name, value in config.items()})
+    return configs
+
+
+# Each worker loads the cached DMatrix files once and shares them between all the trials it runs
+_dtrain = None
+_dvalid = None
+
+
+def _load_features(directory):
+    global _dtrain, _dvalid
+    _dtrain = xgb.DMatrix(str(Path(directory) / 'train.buffer'))
+    _dvalid = xgb.DMatrix(str(Path(directory) / 'valid.buffer'))
+
+
+def run_trial(params, rounds, raw=None, nthread=1):
+    # Train a configuration up to `rounds` boosting rounds, continuing from the booster of its previous rung
+    booster = xgb.Booster(model_file=bytearray(raw)) if raw is not None else None
+    done = booster.num_boosted_rounds() if booster is not None else 0
+    history = {}
+    start = time.perf_counter()
+    booster = xgb.train({**BASE_PARAMS, **params, 'nthread': nthread}, _dtrain, num_boost_round=rounds - done,
+                        evals=[(_dvalid, 'valid')], evals_result=history,
+                        early_stopping_rounds=EARLY_STOPPING_ROUNDS, xgb_model=booster, verbose_eval=False)
+    return bytes(booster.save_raw(raw_format='ubj')), history['valid']['mae'], time.perf_counter() - start
+
+
+def _mae(trial):
+    return min(trial['history'])
+
+
+def successive_halving(configs, directory, workers=None, nthread=1, min_rounds=MIN_ROUNDS, max_rounds=MAX_ROUNDS,
+                       eta=ETA):
+    trials = [{'trial': i, 'params': params, 'history': [], 'train_seconds': 0.0, 'booster': None, 'stopped': False}
+              for i, params in enumerate(configs)]
+    active = trials
+    rounds = min_rounds
+    with ProcessPoolExecutor(workers or os.cpu_count(), initializer=_load_features,
+                             initargs=(directory,)) as executor:
+        while True:
+            running = [trial for trial in active if not trial['stopped']]
+            results = executor.map(run_trial, [trial['params'] for trial in running], [rounds] * len(running),
+                                   [trial['booster'] for trial in running], [nthread] * len(running))
+            for trial, (raw, history, seconds) in zip(running, results):
+                trial['booster'] = raw
+                trial['history'] += history
+                trial['train_seconds'] += seconds
+                # Early stopping ends the trial: more rounds would not lower its validation MAE
+                trial['stopped'] = len(trial['history']) < rounds
+            print(f"{rounds:>5} rounds: {len(running)} trials trained, best validation MAE "
+                  f"{min(_mae(trial) for trial in active):.3f}")
+            active = sorted(active, key=_mae)[:max(1, len(active) // eta)]
+            if rounds >= max_rounds or all(trial['stopped'] for trial in active):
+                break
+            rounds = min(rounds * eta, max_rounds)
+    return trials
+
+
+def best_booster(trial):
+    # The trial's booster cut back to its best validation round
+    booster = xgb.Booster(model_file=bytearray(trial['booster']))
+    return booster[:int(np.argmin(trial['history'])) + 1]
+
+
+def scoring_latency(booster, X, calls=200):
+    # Single-order scoring cost of the booster alone, on one thread as in the scoring service
+    booster.set_param({'nthread': 1})
+    booster.inplace_predict(X[:1])
+    timings = np.empty(calls)
+    for i in range(calls):
+        row = X[i % len(X)][None, :]
+        start = time.perf_counter()
+        booster.inplace_predict(row)
+        timings[i] = time.perf_counter() - start
+    return np.percentile(timings, 50) * 1000, np.percentile(timings, 99) * 1000
+
+
+def pareto_front(results):
+    # Trials no other trial beats on both validation MAE and p99 scoring latency
+    front = []
+    for result in sorted(results, key=lambda r: (r['p99_ms'], r['mae'])):
+        if not front or result['mae'] < front[-1]['mae']:
+            front.append(result)
+    return front
+
+
+def tune(path=data.TRAIN_CSV, trials=27, workers=None, nthread=1, seed=0, calls=200, cache_dir=TUNE_CACHE_DIR):
+    start = time.perf_counter()
+    directory = engineered_features(path, cache_dir)
+    engineered = time.perf_counter()
+    trials = successive_halving(sample_configs(trials, seed), directory, workers, nthread)
+
+    X_valid = np.load(directory / 'valid.npy')
+    results = []
+    for trial in trials:
+        booster = best_booster(trial)
+        p50, p99 = scoring_latency(booster, X_valid, calls)
+        results.append({'trial': trial['trial'], 'params': trial['params'], 'rounds': len(trial['history']),
+                        'best_rounds': booster.num_boosted_rounds(), 'mae': _mae(trial),
+                        'train_seconds': trial['train_seconds'], 'p50_ms': p50, 'p99_ms': p99})
+    front = {result['trial'] for result in pareto_front(results)}
+    for result in results:
+        result['pareto'] = result['trial'] in front
+    print(f"Feature engineering: {engineered - start:.1f}s, search: {time.perf_counter() - engineered:.1f}s")
+    return directory, trials, results
+
+
+def save_trial(directory, trial, output=artifact.MODEL_DIR):
+    pipeline = FeaturePipeline.from_dict(json.loads((directory / 'pipeline.json').read_text()))
+    index = GeoIndex.from_bytes((directory / 'geo.npz').read_bytes())
+    return artifact.save_artifact(best_booster(trial), pipeline, output, geo_index=index)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hyperparameter search with successive halving over parallel trials")
+    parser.add_argument('input', nargs='?', default=str(data.TRAIN_CSV), help="CSV file with the columns of train.csv")
+    parser.add_argument('--trials', type=int, default=27, help="Configurations in the first rung")
+    parser.add_argument('--workers', type=int, default=None, help="Trial processes (default: CPU count)")
+    parser.add_argument('--nthread', type=int, default=1, help="XGBoost threads per trial")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--calls', type=int, default=200, help="Single-order predictions timed per trial")
+    parser.add_argument('--output', help="JSON file to write the trial results to")
+    parser.add_argument('--save', help="Model bundle directory to save the most accurate Pareto-front trial to")
+    parser.add_argument('--max-p99-ms', type=float, help="With --save, only consider trials within this p99 latency")
+    args = parser.parse_args()
+
+    directory, trials, results = tune(args.input, args.trials, args.workers, args.nthread, args.seed, args.calls)
+    print(f"\n{'trial':>5}{'rounds':>8}{'best':>6}{'val MAE':>9}{'train s':>9}{'p50 ms':>8}{'p99 ms':>8}  params")
+    for result in sorted(results, key=lambda r: r['mae']):
+        print(f"{result['trial']:>5}{result['rounds']:>8}{result['best_rounds']:>6}{result['mae']:>9.3f}"
+              f"{result['train_seconds']:>9.2f}{result['p50_ms']:>8.3f}{result['p99_ms']:>8.3f}"
+              f"{'*' if result['pareto'] else ' '} {result['params']}")
+    print("* Pareto front of validation MAE against p99 scoring latency")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.save:
+        candidates = [r for r in results if r['pareto'] and (args.max_p99_ms is None or r['p99_ms'] <= args.max_p99_ms)]
+        if not candidates:
+            raise SystemExit(f"No Pareto-front trial scores within {args.max_p99_ms} ms at p99")
+        chosen = min(candidates, key=lambda r: r['mae'])
+        save_trial(directory, trials[chosen['trial']], args.save)
+        print(f"Saved trial {chosen['trial']} to {args.save}")
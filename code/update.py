@@ -0,0 +1,89 @@
+from pathlib import Path
+import argparse
+import json
+import time
+
+import numpy as np
+import xgboost as xgb
+
+import artifact
+import data
+import main
+import training
+
+LABEL = 'Time_taken(min)'
+# Trees added per update, and the parameters they are grown with (those of main.py's model)
+NUM_BOOST_ROUND = 10
+XGB_PARAMS = {'max_depth': 9}
+
+
+def rescale_thresholds(booster, old_mean, old_scale, new_mean, new_scale):
+    # The trees split on standardized features: move every threshold to the same raw value under the new scaler
+    # statistics, so the existing trees keep routing each order the way they did before the update
+    model = json.loads(booster.save_raw(raw_format='json'))
+    for tree in model['learner']['gradient_booster']['model']['trees']:
+        split = np.asarray(tree['left_children']) != -1
+        feature = np.asarray(tree['split_indices'])[split]
+        threshold = np.asarray(tree['split_conditions'], dtype=np.float32)
+        # Features are rounded to float32 and go left when below the threshold, which is often a feature value
+        # itself. The exact cut between the two sides is half way to the next float32 down: that is the point
+        # mapped, so values equal to the old threshold still go right.
+        cut = (threshold[split].astype('float64') + np.nextafter(threshold[split], np.float32(-np.inf))) / 2
+        raw = cut * old_scale[feature] + old_mean[feature]
+        threshold[split] = (raw - new_mean[feature]) / new_scale[feature]
+        tree['split_conditions'] = threshold.tolist()
+    return xgb.Booster(model_file=bytearray(json.dumps(model).encode()))
+
+
+def update(model_path, orders, num_boost_round=NUM_BOOST_ROUND, params=XGB_PARAMS, output=None):
+    # Warm start from a saved model: fold the new orders into the pipeline's vocabularies and scaler statistics,
+    # then grow num_boost_round more trees on their features only
+    model = artifact.load_artifact(model_path)
+    pipeline = model.pipeline
+    old_mean, old_scale = pipeline.mean_, pipeline.scale_
+
+    orders = main.extract_label_value(orders)
+    X, y = orders.drop(columns=[LABEL]), orders[LABEL]
+    pipeline.partial_fit(X)
+    booster = rescale_thresholds(model.booster, old_mean, old_scale, pipeline.mean_, pipeline.scale_)
+    booster = xgb.train(params, xgb.DMatrix(pipeline.transform(X), label=y), num_boost_round=num_boost_round,
+                        xgb_model=booster)
+
+    # The geo index is kept: pairs it has not seen are computed exactly
+    path = Path(output or model_path)
+    if path.suffix == '.pickle':
+        path = artifact.MODEL_DIR
+    artifact.save_artifact(booster, pipeline, path, geo_index=pipeline.geo_index_)
+    return booster, pipeline
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continue training a saved model on a batch of new orders")
+    parser.add_argument('input', help="CSV file with the columns of train.csv, labels included")
+    parser.add_argument('--model', default=str(artifact.default_model_path()),
+                        help="Model bundle directory or legacy model.pickle to update")
+    parser.add_argument('--output', help="Bundle directory to write (default: the model's own; a pickle is "
+                                         "written to model/)")
+    parser.add_argument('--trees', type=int, default=NUM_BOOST_ROUND, help="Boosting rounds to add")
+    parser.add_argument('--params', type=json.loads, default=XGB_PARAMS,
+                        help="XGBoost parameters for the new trees, as JSON")
+    parser.add_argument('--holdout', help="Labelled CSV to report the MAE on before and after the update")
+    args = parser.parse_args()
+
+    holdout = None
+    if args.holdout:
+        holdout = main.extract_label_value(data.read_train_csv(args.holdout))
+        before = artifact.load_artifact(args.model)
+        y_pred = before.booster.inplace_predict(before.pipeline.transform(holdout.drop(columns=[LABEL])))
+        print("Before the update:")
+        training.evaluate_model(holdout[LABEL], y_pred)
+
+    start = time.perf_counter()
+    booster, pipeline = update(args.model, data.read_train_csv(args.input), args.trees, args.params, args.output)
+    print(f"Added {args.trees} trees ({booster.num_boosted_rounds()} in total) in {time.perf_counter() - start:.1f}s; "
+          f"the scaler has now seen {pipeline.n_samples_seen_:,} rows")
+
+    if holdout is not None:
+        y_pred = booster.inplace_predict(pipeline.transform(holdout.drop(columns=[LABEL])))
+        print("After the update:")
+        training.evaluate_model(holdout[LABEL], y_pred)